@@ -1,7 +1,8 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from app.core.security import verify_token
+from app.core.config import settings
+from app.core.security import verify_token, verify_admin_token
 
 security = HTTPBearer()
 
@@ -22,4 +23,26 @@ async def validate_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    return True
+
+
+async def validate_admin_token(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> bool:
+    """
+    Check that the token matches the admin API token
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Admin API is disabled, set ADMIN_API_TOKEN to enable it",
+        )
+
+    if not verify_admin_token(credentials.credentials):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin API token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
     return True
\ No newline at end of file
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.api.dependencies.auth import validate_admin_token
+from app.api.models.schemas import ProfileReport, ErrorResponse
+from app.services.extractor import get_profile_report
+
+router = APIRouter()
+
+
+@router.get(
+    "/profiles/{extraction_id}",
+    response_model=ProfileReport,
+    responses={
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
+)
+async def get_extraction_profile(
+    extraction_id: str,
+    _: bool = Depends(validate_admin_token),
+):
+    """
+    Get the profile report of a profiled extraction task
+    """
+    try:
+        report = get_profile_report(extraction_id)
+
+        if not report:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No profile found for extraction {extraction_id}",
+            )
+
+        return ProfileReport(**report)
+
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        # Handle other exceptions
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get extraction profile: {str(e)}",
+        )
\ No newline at end of file
@@ -6,9 +6,10 @@ from fastapi.responses import JSONResponse, FileResponse
 
 from app.api.dependencies.auth import validate_token
 from app.api.models.schemas import ExtractionRequest, ExtractionResponse, ExtractionStatus, StatusEnum, ErrorResponse
-from app.services.extractor import extract_questions_async, get_extraction_status
+from app.services.extractor import extract_questions_async, enqueue_extraction, get_extraction_status, cancel_extraction
 from app.utils.file_handler import save_upload_file, get_output_file_path
 from app.core.security import get_api_key_from_env
+from app.core.config import settings
 
 router = APIRouter()
 
@@ -26,6 +27,7 @@ router = APIRouter()
 async def extract_questions(
     use_openai_key: bool = Form(False),
     openai_api_key: str = Form(""),
+    profile: bool = Form(False),
     file: UploadFile = File(...),
     _: bool = Depends(validate_token),
 ):
@@ -57,17 +59,24 @@ async def extract_questions(
         api_key = None
         if extraction_request.use_openai_key and extraction_request.openai_api_key:
             api_key = extraction_request.openai_api_key
+
+        if settings.EXTRACTION_MODE == "queue":
+            # Hand the job to a worker, which uses its own environment key unless one was given
+            await enqueue_extraction(
+                api_key=api_key,
+                file_path=file_path,
+                extraction_id=extraction_id,
+                profile=profile,
+            )
         else:
-            # Use the API key from environment variables
-            api_key = get_api_key_from_env()
-        
-        # Start the extraction process
-        await extract_questions_async(
-            api_key=api_key,
-            file_path=file_path,
-            extraction_id=extraction_id,
-            cleanup=True
-        )
+            # Start the extraction process, using the API key from environment variables by default
+            await extract_questions_async(
+                api_key=api_key or get_api_key_from_env(),
+                file_path=file_path,
+                extraction_id=extraction_id,
+                cleanup=True,
+                profile=profile
+            )
         
         # Return the extraction ID
         return ExtractionResponse(
@@ -104,7 +113,7 @@ async def get_extraction_progress(
     """
     try:
         # Get the extraction task
-        task = get_extraction_status(extraction_id)
+        task = await get_extraction_status(extraction_id)
         
         if not task:
             # Check if the output file exists
@@ -131,7 +140,9 @@ async def get_extraction_progress(
             status=StatusEnum(task.status),
             message=task.message,
             progress=task.progress,
-            questions=task.questions if task.status == "completed" else None,
+            # Questions extracted so far are returned while the extraction runs
+            questions=task.live_questions() if task.status in ("completed", "in_progress") else None,
+            skipped_pages=task.skipped_pages or None,
             extraction_id=extraction_id,
         )
     
@@ -146,6 +157,59 @@ async def get_extraction_progress(
         )
 
 
+@router.delete(
+    "/extract/{extraction_id}",
+    response_model=ExtractionStatus,
+    responses={
+        404: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
+)
+async def cancel_extraction_task(
+    extraction_id: str,
+    _: bool = Depends(validate_token),
+):
+    """
+    Cancel an in-progress extraction task
+    """
+    try:
+        # Get the extraction task
+        task = await get_extraction_status(extraction_id)
+
+        if not task:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Extraction with ID {extraction_id} not found",
+            )
+
+        if task.status not in ("pending", "in_progress"):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Extraction {extraction_id} is already {task.status}",
+            )
+
+        task = await cancel_extraction(extraction_id)
+
+        # Return the extraction status
+        return ExtractionStatus(
+            status=StatusEnum(task.status),
+            message=task.message,
+            progress=task.progress,
+            extraction_id=extraction_id,
+        )
+
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        # Handle other exceptions
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to cancel extraction: {str(e)}",
+        )
+
+
 @router.get(
     "/download/{extraction_id}",
     responses={
@@ -53,9 +53,11 @@ class ExtractionResponse(BaseModel):
 
 
 class StatusEnum(str, Enum):
+    PENDING = "pending"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class ExtractionStatus(BaseModel):
@@ -63,8 +65,50 @@ class ExtractionStatus(BaseModel):
     message: Optional[str] = None
     progress: Optional[float] = None  # 0.0 to 1.0
     questions: Optional[List[Question]] = None
+    skipped_pages: Optional[List[int]] = None  # 1-based pages skipped after timing out
     extraction_id: str
 
 
+class StageProfile(BaseModel):
+    calls: int
+    cpu_seconds: float  # threads of this process
+    wall_seconds: float
+    child_cpu_seconds: Optional[float] = None  # subprocesses such as pdftoppm
+
+
+class AllocationSite(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+
+
+class MemoryProfile(BaseModel):
+    peak_bytes: int  # process-wide tracemalloc peak while the job ran
+    peak_includes_other_jobs: bool = False  # other jobs ran while this one was profiled
+    top_allocations: List[AllocationSite]
+
+
+class BlockingInterval(BaseModel):
+    offset_seconds: float  # since the job started
+    duration_seconds: float
+
+
+class EventLoopBlocking(BaseModel):
+    threshold_seconds: float
+    count: int
+    total_seconds: float
+    intervals: List[BlockingInterval]
+
+
+class ProfileReport(BaseModel):
+    extraction_id: str
+    started_at: Optional[str] = None
+    wall_seconds: float
+    process_cpu_seconds: float
+    memory: MemoryProfile
+    stages: Dict[str, StageProfile]
+    event_loop_blocking: EventLoopBlocking
+
+
 class ErrorResponse(BaseModel):
     detail: str
\ No newline at end of file
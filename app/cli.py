@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.security import get_api_key_from_env
+from app.services.extractor import ExtractionTask, extract_pages
+from app.services.scheduler import scheduler
+from app.utils.file_handler import get_output_file_path
+
+
+def find_documents(source: str, manifest: bool) -> List[Tuple[str, str]]:
+    """
+    List (document ID, path) pairs from a directory of PDFs or a manifest
+    file with one PDF path per line. IDs are relative to the directory or
+    the manifest's own directory, so they stay the same as the manifest grows.
+    """
+    if manifest:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as file:
+            paths = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+        paths = [path if os.path.isabs(path) else os.path.join(base_dir, path) for path in paths]
+    else:
+        base_dir = source
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        paths.sort()
+
+    documents = []
+    used_ids = set()
+    for path in paths:
+        relative_name = os.path.splitext(os.path.relpath(path, base_dir))[0]
+        base_id = "".join(e if e.isalnum() or e in "-_" else "_" for e in relative_name)
+        # Different names can sanitize to the same ID (e.g. "a b.pdf" and "a_b.pdf"),
+        # which would share output and checkpoint files. Paths are listed in a stable
+        # order, so the suffixes stay the same when a run is resumed.
+        document_id = base_id
+        suffix = 2
+        while document_id.lower() in used_ids:
+            document_id = f"{base_id}-{suffix}"
+            suffix += 1
+        used_ids.add(document_id.lower())
+        documents.append((document_id, path))
+    return documents
+
+
+def _checkpoint_path(document_id: str) -> str:
+    return os.path.join(settings.OUTPUT_DIR, f"{document_id}.pages.jsonl")
+
+
+def load_checkpoint(document_id: str) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Load the pages already extracted for a document
+    """
+    completed_pages = {}
+    checkpoint = _checkpoint_path(document_id)
+    if os.path.exists(checkpoint):
+        with open(checkpoint, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written last line from an interrupted run
+                    continue
+                completed_pages[record["page"]] = record["questions"]
+    return completed_pages
+
+
+def truncate_torn_line(path: str) -> None:
+    """
+    Cut a file back to its last newline, dropping a line left half written
+    by an interrupted run so new lines are not appended onto it
+    """
+    with open(path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - 64 * 1024, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline != -1:
+                file.truncate(start + newline + 1)
+                return
+            end = start
+        file.truncate(0)
+
+
+def load_completed_jsonl(jsonl_path: str) -> Set[str]:
+    """
+    Get the IDs of documents already written to a combined JSONL output
+    """
+    completed = set()
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, 'r') as file:
+            for line in file:
+                try:
+                    completed.add(json.loads(line)["document"])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+    return completed
+
+
+class BulkRun:
+    """
+    Counters shared by the documents of a bulk extraction run
+    """
+    def __init__(self, total_documents: int):
+        self.total_documents = total_documents
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.pages = 0
+        self.resumed_pages = 0
+        self.questions = 0
+        self.failures: List[Tuple[str, str]] = []
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        finished = self.completed + self.failed + self.skipped
+        return (
+            f"documents {finished}/{self.total_documents} "
+            f"(failed {self.failed}) | pages {self.pages} | questions {self.questions} | "
+            f"{self.pages / elapsed if elapsed else 0.0:.2f} pages/s"
+        )
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        lines = [
+            f"Finished in {elapsed:.1f}s",
+            f"  documents: {self.completed} completed, {self.failed} failed, {self.skipped} already done",
+            f"  pages:     {self.pages} extracted, {self.resumed_pages} resumed from checkpoints",
+            f"  questions: {self.questions}",
+            f"  throughput: {self.pages / elapsed if elapsed else 0.0:.2f} pages/s, "
+            f"{self.completed * 60 / elapsed if elapsed else 0.0:.2f} documents/min",
+        ]
+        lines.extend(f"  failed {document_id}: {error}" for document_id, error in self.failures)
+        return "\n".join(lines)
+
+
+async def _extract_document(
+    api_key: str,
+    document_id: str,
+    path: str,
+    run: BulkRun,
+    resume: bool,
+    jsonl_file=None,
+) -> None:
+    """
+    Extract one document, checkpointing each page so an interrupted run can resume
+    """
+    checkpoint = _checkpoint_path(document_id)
+    completed_pages = load_checkpoint(document_id) if resume else {}
+    run.resumed_pages += len(completed_pages)
+
+    task = ExtractionTask(document_id, document_id)
+    with open(checkpoint, 'w') as checkpoint_file:
+        def write_page(page_num: int, page_questions: List[Dict[str, Any]]) -> None:
+            checkpoint_file.write(json.dumps({"page": page_num, "questions": page_questions}) + "\n")
+            checkpoint_file.flush()
+
+        # Rewrite resumed pages so a torn line from an interrupted run is dropped
+        for page_num, page_questions in completed_pages.items():
+            write_page(page_num, page_questions)
+
+        def on_page(page_num: int, page_questions: List[Dict[str, Any]]) -> None:
+            write_page(page_num, page_questions)
+            run.pages += 1
+            run.questions += len(page_questions)
+
+        questions = await extract_pages(
+            api_key, path, document_id, task,
+            completed_pages=completed_pages, on_page=on_page,
+        )
+
+    # Leave the checkpoint in place so a resumed run retries the timed out pages
+    if task.skipped_pages:
+        raise RuntimeError(f"Pages {task.skipped_pages} timed out, rerun with --resume to retry them")
+
+    if jsonl_file is not None:
+        jsonl_file.write(json.dumps({
+            "document": document_id,
+            "source": path,
+            "questions": questions,
+        }) + "\n")
+        jsonl_file.flush()
+    else:
+        # An existing output marks the document as done, so never leave a partial one
+        output_file = get_output_file_path(document_id)
+        with open(f"{output_file}.tmp", 'w') as file:
+            json.dump(questions, file, indent=4)
+        os.replace(f"{output_file}.tmp", output_file)
+    os.remove(checkpoint)
+
+
+async def _report_progress(run: BulkRun, interval: float) -> None:
+    while True:
+        print(f"\r{run.line()}", end="", file=sys.stderr, flush=True)
+        await asyncio.sleep(interval)
+
+
+async def run_bulk(
+    documents: List[Tuple[str, str]],
+    api_key: str,
+    concurrency: int,
+    resume: bool,
+    jsonl_path: Optional[str] = None,
+    progress: bool = True,
+) -> BulkRun:
+    """
+    Extract questions from many PDFs, `concurrency` documents at a time
+    """
+    os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
+    done = set()
+    if resume:
+        if jsonl_path:
+            done = load_completed_jsonl(jsonl_path)
+        else:
+            done = {
+                document_id for document_id, _ in documents
+                if os.path.exists(get_output_file_path(document_id))
+            }
+
+    run = BulkRun(len(documents))
+    run.skipped = len([document_id for document_id, _ in documents if document_id in done])
+    semaphore = asyncio.Semaphore(concurrency)
+    if resume and jsonl_path and os.path.exists(jsonl_path):
+        truncate_torn_line(jsonl_path)
+    jsonl_file = open(jsonl_path, 'a' if resume else 'w') if jsonl_path else None
+
+    async def extract(document_id: str, path: str) -> None:
+        async with semaphore:
+            try:
+                await _extract_document(api_key, document_id, path, run, resume, jsonl_file)
+                run.completed += 1
+            except Exception as e:
+                run.failed += 1
+                run.failures.append((document_id, str(e)))
+
+    reporter = asyncio.create_task(_report_progress(run, 1.0)) if progress else None
+    try:
+        await asyncio.gather(*(
+            extract(document_id, path)
+            for document_id, path in documents
+            if document_id not in done
+        ))
+    finally:
+        if reporter:
+            reporter.cancel()
+            print(f"\r{run.line()}", file=sys.stderr)
+        if jsonl_file:
+            jsonl_file.close()
+    return run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Extract questions from a directory or manifest of PDFs without going through the API"
+    )
+    parser.add_argument("source", help="Directory of PDFs, or a manifest file with --manifest")
+    parser.add_argument("--manifest", action="store_true", help="Treat source as a file listing one PDF path per line")
+    parser.add_argument("--jsonl", help="Write all results to this JSONL file instead of one JSON file per document")
+    parser.add_argument("--documents", type=int, default=4, help="Number of documents to process at a time")
+    parser.add_argument(
+        "--pages", type=int, default=settings.MAX_CONCURRENT_PAGES,
+        help="Number of pages to send to the LLM at a time",
+    )
+    parser.add_argument("--resume", action="store_true", help="Skip documents and pages completed by a previous run")
+    parser.add_argument("--api-key", help="OpenAI API key (defaults to OPENAI_API_KEY)")
+    parser.add_argument("--no-progress", action="store_true", help="Disable the progress display")
+    args = parser.parse_args()
+
+    documents = find_documents(args.source, args.manifest)
+    if not documents:
+        parser.error(f"No PDF files found in {args.source}")
+
+    scheduler.max_concurrency = args.pages
+    run = asyncio.run(run_bulk(
+        documents,
+        api_key=args.api_key or get_api_key_from_env(),
+        concurrency=args.documents,
+        resume=args.resume,
+        jsonl_path=args.jsonl,
+        progress=not args.no_progress,
+    ))
+    print(run.summary())
+    sys.exit(1 if run.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
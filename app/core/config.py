@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 import os
 from dotenv import load_dotenv
@@ -14,6 +14,8 @@ class Settings(BaseSettings):
     
     # Security settings
     API_TOKEN: str = os.getenv("API_TOKEN", "your-api-token")
+    # Admin endpoints are disabled unless this is set; it never falls back to API_TOKEN
+    ADMIN_API_TOKEN: Optional[str] = os.getenv("ADMIN_API_TOKEN")
     
     # API keys and settings
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY", "api-key")
@@ -23,6 +25,43 @@ class Settings(BaseSettings):
     OUTPUT_DIR: str = "outputs"
     MAX_UPLOAD_SIZE: int = 20 * 1024 * 1024  # 20 MB
 
+    # Scheduling and provider limits (applied per API key)
+    MAX_CONCURRENT_PAGES: int = 4
+    RATE_LIMIT_RPM: int = 500
+    RATE_LIMIT_TPM: int = 30000
+    ESTIMATED_TOKENS_PER_PAGE: int = 4000
+    DAILY_TOKEN_BUDGET: Optional[int] = None  # None means unlimited
+    # Overrides keyed by API key fingerprint (see app.services.scheduler.key_fingerprint)
+    TENANT_WEIGHTS: Dict[str, float] = {}
+    TENANT_DAILY_TOKEN_BUDGETS: Dict[str, int] = {}
+
+    # Stream LLM output so questions are available as soon as each one is generated
+    STREAM_LLM_RESPONSES: bool = True
+
+    # Deadlines (None disables); a page's deadline covers its run time, not time spent queued
+    PAGE_TIMEOUT_SECONDS: Optional[float] = 180
+    JOB_TIMEOUT_SECONDS: Optional[float] = 3600
+    SKIP_TIMED_OUT_PAGES: bool = True  # False fails the whole job instead
+
+    # Where extraction runs: "inline" in the API process, or "queue" for app.worker processes
+    EXTRACTION_MODE: str = "inline"
+    JOB_QUEUE_BACKEND: str = "sqlite"
+    JOB_QUEUE_PATH: str = "outputs/jobs.db"
+    JOB_LEASE_SECONDS: float = 60
+    JOB_HEARTBEAT_SECONDS: float = 15
+    JOB_MAX_ATTEMPTS: int = 3
+    WORKER_CONCURRENCY: int = 2  # jobs per worker process
+    WORKER_POLL_SECONDS: float = 2
+    WORKER_PARTIAL_OUTPUT_SECONDS: float = 2  # how often streamed questions are published
+
+    # Job profiling, enabled per request or for a sampled fraction of jobs
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_TOP_ALLOCATIONS: int = 10
+    PROFILE_MEMORY_SAMPLE_SECONDS: float = 5.0  # minimum time between allocation snapshots
+    PROFILE_LOOP_CHECK_SECONDS: float = 0.05
+    PROFILE_BLOCK_THRESHOLD_SECONDS: float = 0.1
+    PROFILE_TOP_BLOCKING_INTERVALS: int = 20
+
     # Prompts file path
     PROMPTS_FILE: str = "prompts/prompts.json"
     
@@ -13,6 +13,15 @@ def verify_token(token: str) -> bool:
     return token == api_token
 
 
+def verify_admin_token(token: str) -> bool:
+    """
+    Verify the token against the stored admin API token
+    Returns True if the token is valid, False otherwise (including when no
+    admin token is configured)
+    """
+    return bool(settings.ADMIN_API_TOKEN) and token == settings.ADMIN_API_TOKEN
+
+
 def get_api_key_from_env() -> str:
     """
     Get the OpenAI API key from environment variables
@@ -6,6 +6,7 @@ import json
 
 from app.core.config import settings
 from app.api.endpoints.questions import router as questions_router
+from app.api.endpoints.admin import router as admin_router
 
 
 def create_app() -> FastAPI:
@@ -55,6 +56,9 @@ def create_app() -> FastAPI:
     app.include_router(
         questions_router, prefix=f"/question-extractor", tags=["questions"]
     )
+    app.include_router(
+        admin_router, prefix=f"/question-extractor/admin", tags=["admin"]
+    )
 
     @app.get("/")
     def root():
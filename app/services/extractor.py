@@ -3,12 +3,20 @@ import os
 import uuid
 import asyncio
 import base64
-from typing import List, Dict, Any, Optional
-from pdf2image import convert_from_path
+import threading
+import time
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pdf2image.exceptions import PDFPopplerTimeoutError
 
-from app.services.llm import LLM, Message, Role
+from app.services.llm import LLM, Message, ResponseCancelled, Role
 from app.services.models import Questions, Question
-from app.utils.file_handler import get_output_file_path, clean_up_files
+from app.services.scheduler import PageTimeout, key_fingerprint, scheduler
+from app.services.queue import QueuedJob, get_job_queue
+from app.services.profiler import JobProfiler, job_finished, job_started, profile_stage, should_profile
+from app.utils.file_handler import (
+    get_output_file_path, get_partial_output_file_path, get_profile_file_path, clean_up_files
+)
 from app.core.config import settings
 
 # Dictionary to track extraction progress
@@ -42,14 +50,89 @@ class ExtractionTask:
         self.message = "Extraction started"
         self.progress = 0.0
         self.questions = []
+        # Questions streamed so far for pages still being generated, by page index.
+        # A page's buffer is dropped if it fails and moved to `questions` once it completes.
+        self.page_buffers: Dict[int, List[Dict[str, Any]]] = {}
+        self.skipped_pages = []
         self.error = None
+        # Background asyncio task running the extraction
+        self.job: Optional[asyncio.Task] = None
+        # Set when the job is profiled; the report is stored in `profile`
+        self.profiler: Optional[JobProfiler] = None
+        self.profile: Optional[Dict[str, Any]] = None
+
+    def live_questions(self) -> List[Dict[str, Any]]:
+        """
+        Questions of completed pages followed by those streamed for pages in progress
+        """
+        questions = list(self.questions)
+        for _, page_buffer in sorted(self.page_buffers.items()):
+            questions.extend(page_buffer)
+        return questions
+
+
+async def enqueue_extraction(
+    api_key: Optional[str],
+    file_path: str,
+    extraction_id: str,
+    profile: bool = False
+) -> str:
+    """
+    Queue a PDF file for extraction by a worker process (see app.worker)
+    """
+    job = QueuedJob(
+        extraction_id,
+        file_path,
+        api_key=api_key,
+        profile=should_profile(profile),
+        # Workers run without a caller key under their env key, as inline jobs do
+        key_fingerprint=key_fingerprint(api_key or settings.OPENAI_API_KEY or ""),
+    )
+    # Queue calls may wait on the database lock, keep them off the event loop
+    await asyncio.to_thread(lambda: get_job_queue().enqueue(job))
+    return extraction_id
+
+
+def _task_from_job(job: QueuedJob) -> ExtractionTask:
+    """
+    Build an ExtractionTask view of a job tracked in the job queue
+    """
+    task = ExtractionTask(job.extraction_id, os.path.basename(job.file_path).split('.')[0])
+    task.status = job.status
+    task.message = job.message
+    task.progress = job.progress
+    task.skipped_pages = job.skipped_pages
+    task.error = job.error
+    output_file = get_output_file_path(job.extraction_id)
+    if job.status == "completed" and os.path.exists(output_file):
+        with open(output_file, 'r') as file:
+            task.questions = json.load(file)
+    elif job.status == "in_progress":
+        # Questions streamed so far, published by the worker running the job
+        try:
+            with open(get_partial_output_file_path(job.extraction_id), 'r') as file:
+                task.questions = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            pass
+    return task
+
+
+def _get_queued_task(extraction_id: str) -> Optional[ExtractionTask]:
+    job = get_job_queue().get(extraction_id)
+    return _task_from_job(job) if job else None
+
+
+def _cancel_queued_task(extraction_id: str) -> Optional[ExtractionTask]:
+    job = get_job_queue().cancel(extraction_id)
+    return _task_from_job(job) if job else None
 
 
 async def extract_questions_async(
     api_key: str,
     file_path: str,
     extraction_id: str,
-    cleanup: bool = True
+    cleanup: bool = True,
+    profile: bool = False
 ) -> str:
     """
     Extract questions from a PDF file asynchronously
@@ -60,15 +143,295 @@ async def extract_questions_async(
     # Create a task to track progress
     task = ExtractionTask(extraction_id, file_name)
     extraction_tasks[extraction_id] = task
+    if should_profile(profile):
+        task.profiler = JobProfiler(extraction_id)
     
-    # Run the extraction in the background
-    asyncio.create_task(
+    # Run the extraction in the background, keeping a handle so it can be cancelled
+    task.job = asyncio.create_task(
         _run_extraction(api_key, file_path, extraction_id, file_name, task, cleanup)
     )
     
     return extraction_id
 
 
+def _format_question(question: Question) -> Dict[str, Any]:
+    """
+    Convert an extracted question into the API response format
+    """
+    return {
+        "id": question.id,
+        "question": question.question,
+        "passage": question.passage,
+        "assertion": question.assertion,
+        "reason": question.reason,
+        "choices": [question.a, question.b, question.c, question.d],
+        "solution": {
+            "steps": [{"explanation": step.explanation, "output": step.output} for step in question.solution],
+        },
+        "final_answer": question.final_answer,
+        "topic": question.topic,
+        "sub_topic": question.sub_topic,
+        "question_type": question.question_type,
+        "allocated_marks": question.allocated_marks,
+        "reference_exam": question.reference_exam
+    }
+
+
+def _process_page(
+    llm: LLM,
+    system_prompt: str,
+    page,
+    image_path: str,
+    on_question: Optional[Callable[[Dict[str, Any]], None]] = None,
+    profiler: Optional[JobProfiler] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> List[Dict[str, Any]]:
+    """
+    Extract questions from a single PDF page (blocking, run by the scheduler).
+    When `on_question` is given the response is streamed and each question is
+    passed to it as soon as it has been generated. Setting `cancel_event`
+    stops the page before or during the LLM request.
+    """
+    # The scheduler's page timeout starts when the page is dispatched, i.e. now;
+    # LLM retries stop before it runs out
+    deadline = time.monotonic() + settings.PAGE_TIMEOUT_SECONDS if settings.PAGE_TIMEOUT_SECONDS else None
+
+    with profile_stage(profiler, "encode_image"):
+        # Save the page as a temp image
+        page.save(image_path, "PNG")
+
+        try:
+            # Load the image
+            input_image = load_image(image_path)
+        finally:
+            # Clean up the temp image
+            os.remove(image_path)
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise ResponseCancelled("Page cancelled before the LLM request")
+
+    # Extract questions using LLM
+    messages = [Message(
+        Role.USER,
+        f"Here is the image containing questions.",
+        image=input_image
+    )]
+    if on_question:
+        def emit(item: Dict[str, Any]) -> None:
+            with profile_stage(profiler, "parse_questions"):
+                question = Question.model_validate(item)
+            with profile_stage(profiler, "format_questions"):
+                on_question(_format_question(question))
+
+        # Streamed questions are parsed and formatted while the request is running
+        with profile_stage(profiler, "llm_request"):
+            questions_result = llm.generate_response_stream(
+                system_prompt,
+                messages,
+                response_format=Questions,
+                on_item=emit,
+                cancel_event=cancel_event,
+                deadline=deadline
+            )
+    else:
+        # Parsing into the response model happens inside the client call
+        with profile_stage(profiler, "llm_request"):
+            questions_result = llm.generate_response(
+                system_prompt,
+                messages,
+                response_format=Questions,
+                cancel_event=cancel_event,
+                deadline=deadline
+            )
+
+    if profiler:
+        # Sampled on this thread so the snapshot does not block the event loop
+        profiler.sample_memory()
+
+    with profile_stage(profiler, "format_questions"):
+        return [_format_question(question) for question in questions_result.questions]
+
+
+def _rasterize(
+    file_path: str,
+    timeout: Optional[float] = None,
+    skip_pages: Optional[Set[int]] = None
+) -> Tuple[int, List[Tuple[int, Any]]]:
+    if not skip_pages:
+        images = convert_from_path(file_path, timeout=timeout)
+        return len(images), list(enumerate(images))
+
+    started = time.monotonic()
+
+    def time_left() -> Optional[float]:
+        if timeout is None:
+            return None
+        left = timeout - (time.monotonic() - started)
+        if left <= 0:
+            raise PDFPopplerTimeoutError("Run poppler timeout.")
+        return left
+
+    total_pages = pdfinfo_from_path(file_path, timeout=time_left())["Pages"]
+    missing = [page_num for page_num in range(total_pages) if page_num not in skip_pages]
+
+    # Convert each run of consecutive missing pages with one pdftoppm call
+    pages = []
+    run_start = 0
+    while run_start < len(missing):
+        run_end = run_start
+        while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+            run_end += 1
+        first_page, last_page = missing[run_start], missing[run_end]
+        images = convert_from_path(
+            file_path, first_page=first_page + 1, last_page=last_page + 1, timeout=time_left()
+        )
+        pages.extend(zip(range(first_page, last_page + 1), images))
+        run_start = run_end + 1
+    return total_pages, pages
+
+
+def _load_pdf(
+    file_path: str,
+    profiler: Optional[JobProfiler] = None,
+    timeout: Optional[float] = None,
+    skip_pages: Optional[Set[int]] = None
+) -> Tuple[int, List[Tuple[int, Any]]]:
+    """
+    Rasterize the pages of a PDF not in `skip_pages` (page indexes), killing
+    poppler once `timeout` seconds have passed. Returns the page count and
+    (page index, image) pairs.
+    """
+    with profile_stage(profiler, "rasterize", children=True):
+        pdf_pages = _rasterize(file_path, timeout, skip_pages)
+    if profiler:
+        # Sampled on this thread so the snapshot does not block the event loop
+        profiler.sample_memory()
+    return pdf_pages
+
+
+async def extract_pages(
+    api_key: str,
+    file_path: str,
+    file_name: str,
+    task: ExtractionTask,
+    completed_pages: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+    on_page: Optional[Callable[[int, List[Dict[str, Any]]], None]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Extract questions from every page of a PDF, reporting progress on `task`.
+    Pages already in `completed_pages` (page index -> questions) are not sent
+    to the LLM again; `on_page` is called as each remaining page completes.
+    Returns the questions in page order.
+    """
+    completed_pages = dict(completed_pages or {})
+
+    # The job deadline covers rasterization as well as the pages
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.JOB_TIMEOUT_SECONDS if settings.JOB_TIMEOUT_SECONDS else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(deadline - loop.time(), 0.0)
+
+    def job_timeout() -> asyncio.TimeoutError:
+        return asyncio.TimeoutError(
+            f"Extraction did not finish within {settings.JOB_TIMEOUT_SECONDS} seconds"
+        )
+
+    # Load prompts
+    task.message = "Loading prompts"
+    with profile_stage(task.profiler, "load_prompts"):
+        prompts = load_prompts(settings.PROMPTS_FILE)
+
+    # Initialize LLM, reporting token usage to the scheduler for rate limits and budgets
+    task.message = "Initializing LLM"
+    llm = LLM(
+        api_key=api_key,
+        on_usage=lambda prompt_tokens, completion_tokens: scheduler.record_usage(
+            api_key, prompt_tokens, completion_tokens
+        ),
+        timeout=settings.PAGE_TIMEOUT_SECONDS,
+    )
+
+    # Load PDF
+    task.message = "Loading PDF"
+    try:
+        total_pages, pdf_pages = await asyncio.wait_for(
+            # Pages resumed from a checkpoint are not rasterized again
+            asyncio.to_thread(_load_pdf, file_path, task.profiler, remaining(), set(completed_pages)),
+            timeout=remaining()
+        )
+    except (asyncio.TimeoutError, PDFPopplerTimeoutError) as e:
+        raise job_timeout() from e
+    done_pages = len([page_num for page_num in completed_pages if page_num < total_pages])
+    task.progress = done_pages / total_pages if total_pages else 0.0
+    task.message = f"Processing {total_pages} pages"
+
+    async def process_page(page_num: int, page) -> None:
+        nonlocal done_pages
+        # Set by the scheduler when the page times out or is cancelled
+        cancel_event = threading.Event()
+        # Streamed questions are only shown while the page runs; a page that fails
+        # or is cancelled part-way must not leave questions behind
+        page_buffer = task.page_buffers.setdefault(page_num, [])
+        # Pages are queued per API key and shared fairly with other jobs
+        try:
+            page_questions = await scheduler.run(
+                api_key,
+                _process_page,
+                llm,
+                prompts["extract_questions"]["cuet-ug"],
+                page,
+                f"{file_name}_{page_num}.png",
+                page_buffer.append if settings.STREAM_LLM_RESPONSES else None,
+                task.profiler,
+                cancel_event,
+                flow=task.extraction_id,
+                timeout=settings.PAGE_TIMEOUT_SECONDS,
+                cancel_event=cancel_event,
+            )
+        except PageTimeout:
+            if not settings.SKIP_TIMED_OUT_PAGES:
+                raise
+            task.skipped_pages.append(page_num + 1)
+            page_questions = None
+        finally:
+            task.page_buffers.pop(page_num, None)
+        done_pages += 1
+        task.progress = done_pages / total_pages
+        task.message = f"Processed {done_pages} of {total_pages} pages"
+        if page_questions is not None:
+            completed_pages[page_num] = page_questions
+            task.questions.extend(page_questions)
+            if on_page:
+                on_page(page_num, page_questions)
+
+    # Process each remaining page
+    page_jobs = [
+        asyncio.ensure_future(process_page(page_num, page))
+        for page_num, page in pdf_pages
+        if page_num not in completed_pages
+    ]
+    try:
+        await asyncio.wait_for(asyncio.gather(*page_jobs), timeout=remaining())
+    except PageTimeout:
+        raise
+    except asyncio.TimeoutError as e:
+        raise job_timeout() from e
+    finally:
+        # Stop outstanding pages on failure and release the rasterized pages
+        for page_job in page_jobs:
+            page_job.cancel()
+        pdf_pages.clear()
+
+    # Keep questions in page order
+    return [
+        question
+        for page_num in sorted(completed_pages)
+        if page_num < total_pages
+        for question in completed_pages[page_num]
+    ]
+
+
 async def _run_extraction(
     api_key: str,
     file_path: str,
@@ -81,98 +444,86 @@ async def _run_extraction(
     Background task to run the extraction
     """
     output_file = get_output_file_path(extraction_id)
+    job_started(extraction_id)
+    if task.profiler:
+        task.profiler.start()
     
     try:
-        # Load prompts
-        task.message = "Loading prompts"
-        prompts = load_prompts(settings.PROMPTS_FILE)
-        
-        # Initialize LLM
-        task.message = "Initializing LLM"
-        llm = LLM(api_key=api_key)
-        
-        # Load PDF
-        task.message = "Loading PDF"
-        pdf_pages = convert_from_path(file_path)
-        total_pages = len(pdf_pages)
-        
-        # Process each page
-        extracted_questions = []
-        for page_num, page in enumerate(pdf_pages):
-            # Update progress
-            task.progress = page_num / total_pages
-            task.message = f"Processing page {page_num + 1} of {total_pages}"
-            
-            # Save the page as a temp image
-            image_path = f"{file_name}_{page_num}.png"
-            page.save(image_path, "PNG")
-            
-            # Load the image
-            input_image = load_image(image_path)
-            
-            # Extract questions using LLM
-            questions_result = llm.generate_response(
-                prompts["extract_questions"]["cuet-ug"],
-                [Message(
-                    Role.USER,
-                    f"Here is the image containing questions.",
-                    image=input_image
-                )],
-                response_format=Questions
-            )
-            
-            # Clean up the temp image
-            os.remove(image_path)
-            
-            # Process the extracted questions
-            for question in questions_result.questions:
-                extracted_question = {
-                    "id": question.id,
-                    "question": question.question,
-                    "passage": question.passage,
-                    "assertion": question.assertion,
-                    "reason": question.reason,
-                    "choices": [question.a, question.b, question.c, question.d],
-                    "solution": {
-                        "steps": [{"explanation": step.explanation, "output": step.output} for step in question.solution],
-                    },
-                    "final_answer": question.final_answer,
-                    "topic": question.topic,
-                    "sub_topic": question.sub_topic,
-                    "question_type": question.question_type,
-                    "allocated_marks": question.allocated_marks,
-                    "reference_exam": question.reference_exam
-                }
-                extracted_questions.append(extracted_question)
-                task.questions.append(extracted_question)
+        extracted_questions = await extract_pages(api_key, file_path, file_name, task)
+        task.questions = extracted_questions
         
         # Save the extracted questions
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w') as file:
-            json.dump(extracted_questions, file, indent=4)
+        with profile_stage(task.profiler, "write_output"):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, 'w') as file:
+                json.dump(extracted_questions, file, indent=4)
         
         # Update task status
         task.status = "completed"
         task.progress = 1.0
         task.message = "Extraction completed successfully"
-        
-        # Clean up the input file if needed
-        if cleanup:
-            clean_up_files(file_path)
-            
+        if task.skipped_pages:
+            task.message += f" (skipped timed out pages: {task.skipped_pages})"
+
+    except asyncio.CancelledError:
+        task.status = "cancelled"
+        task.message = "Extraction cancelled"
+        raise
+
     except Exception as e:
         # Update task with error information
         task.status = "failed"
         task.message = f"Extraction failed: {str(e)}"
         task.error = str(e)
-        
+
+    finally:
+        job_finished(extraction_id)
+
         # Clean up the input file if needed
         if cleanup:
             clean_up_files(file_path)
 
+        # Keep the profile report with the job and next to its output
+        if task.profiler:
+            task.profile = task.profiler.stop()
+            with open(get_profile_file_path(extraction_id), 'w') as file:
+                json.dump(task.profile, file, indent=4)
 
-def get_extraction_status(extraction_id: str) -> Optional[ExtractionTask]:
+
+async def cancel_extraction(extraction_id: str) -> Optional[ExtractionTask]:
+    """
+    Cancel a running extraction task, returns None if it does not exist
+    """
+    task = extraction_tasks.get(extraction_id)
+    if task and task.status == "in_progress" and task.job:
+        task.status = "cancelled"
+        task.message = "Extraction cancelled"
+        task.job.cancel()
+    if task is None and settings.EXTRACTION_MODE == "queue":
+        # The worker running the job stops at its next heartbeat
+        return await asyncio.to_thread(_cancel_queued_task, extraction_id)
+    return task
+
+
+async def get_extraction_status(extraction_id: str) -> Optional[ExtractionTask]:
     """
     Get the status of an extraction task
     """
-    return extraction_tasks.get(extraction_id)
\ No newline at end of file
+    task = extraction_tasks.get(extraction_id)
+    if task is None and settings.EXTRACTION_MODE == "queue":
+        return await asyncio.to_thread(_get_queued_task, extraction_id)
+    return task
+
+
+def get_profile_report(extraction_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the profile report of an extraction, returns None if it was not profiled
+    """
+    task = extraction_tasks.get(extraction_id)
+    if task and task.profile:
+        return task.profile
+    profile_file = get_profile_file_path(extraction_id)
+    if os.path.exists(profile_file):
+        with open(profile_file, 'r') as file:
+            return json.load(file)
+    return None
@@ -1,8 +1,12 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import List, Optional, TypeVar, Type, Dict, Any
-from openai import OpenAI
+from typing import List, Optional, TypeVar, Type, Dict, Any, Callable
+from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
 import json
+import threading
+import time
+
+from app.utils.json_stream import JSONArrayItemParser
 
 
 class Role(str, Enum):
@@ -30,10 +34,29 @@ class Message:
                     {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{self.image}"}}
                 ]}
 
+class ResponseCancelled(Exception):
+    """
+    Raised when a streamed response is stopped through its cancel event
+    """
+
+
+# Errors the SDK would retry: rate limits, server errors and dropped or timed out connections
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
 class LLM:
-    def __init__(self, api_key, model_name="gpt-4o-2024-08-06"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, model_name="gpt-4o-2024-08-06", on_usage=None, timeout=None,
+                 max_retries=2):
+        # Retries are done here rather than in the SDK so they can stop at the
+        # caller's deadline and cancel event
+        if timeout is not None:
+            self.client = OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+        else:
+            self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.max_retries = max_retries
         self.model_name = model_name
+        # Optional callback(prompt_tokens, completion_tokens) for each response
+        self.on_usage = on_usage
 
         self.input_tokens = 0
         self.output_tokens = 0
@@ -41,27 +64,124 @@ class LLM:
     def update_token_usage(self, response):
         self.input_tokens += response.usage.prompt_tokens
         self.output_tokens += response.usage.completion_tokens
+        if self.on_usage:
+            self.on_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+
+    @staticmethod
+    def _retry_delay(error, attempt: int) -> float:
+        # Honour the server's Retry-After, otherwise back off exponentially like the SDK
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                return float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        return min(0.5 * 2 ** attempt, 8.0)
+
+    def _request(self,
+                 send: Callable[[OpenAI], Any],
+                 cancel_event: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None,
+                 can_retry: Callable[[], bool] = lambda: True):
+        """
+        Call send(client), retrying transient errors up to max_retries times.
+        Attempts are cut to the time left before `deadline` (time.monotonic()),
+        and no retry is made once the deadline would pass or `cancel_event` is set.
+        """
+        attempt = 0
+        while True:
+            client = self.client
+            if deadline is not None:
+                client = client.with_options(timeout=max(deadline - time.monotonic(), 1.0))
+            try:
+                return send(client)
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(e, attempt)
+                attempt += 1
+                if attempt > self.max_retries or not can_retry():
+                    raise
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise ResponseCancelled("Response cancelled") from e
+                else:
+                    time.sleep(delay)
 
     def generate_response(self,
                           system_prompt: str,
                           messages: List[Message],
-                          response_format = None):
+                          response_format = None,
+                          cancel_event: Optional[threading.Event] = None,
+                          deadline: Optional[float] = None):
         messages = [message.format_message() for message in messages]
         messages = [{"role": Role.SYSTEM.value, "content": system_prompt}] + messages
         if response_format:
-            response = self.client.beta.chat.completions.parse(
-                model=self.model_name,
-                messages=messages,
-                response_format=response_format
+            response = self._request(
+                lambda client: client.beta.chat.completions.parse(
+                    model=self.model_name,
+                    messages=messages,
+                    response_format=response_format
+                ),
+                cancel_event,
+                deadline,
             )
 
             self.update_token_usage(response)
             return response.choices[0].message.parsed
         else:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages
+            response = self._request(
+                lambda client: client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages
+                ),
+                cancel_event,
+                deadline,
             )
 
             self.update_token_usage(response)
             return response.choices[0].message.content
+
+    def generate_response_stream(self,
+                                 system_prompt: str,
+                                 messages: List[Message],
+                                 response_format,
+                                 on_item: Callable[[Dict[str, Any]], None],
+                                 cancel_event: Optional[threading.Event] = None,
+                                 deadline: Optional[float] = None):
+        """
+        Stream a structured response, calling on_item with each element of the
+        response's list field (e.g. Questions.questions) as soon as it is
+        complete. Returns the fully parsed response. Setting `cancel_event`
+        closes the stream and raises ResponseCancelled.
+
+        A failed stream is only retried if no item was passed to on_item yet,
+        so items are never emitted twice.
+        """
+        messages = [message.format_message() for message in messages]
+        messages = [{"role": Role.SYSTEM.value, "content": system_prompt}] + messages
+        emitted = []
+
+        def emit(item: Dict[str, Any]) -> None:
+            emitted.append(True)
+            on_item(item)
+
+        def send(client: OpenAI):
+            parser = JSONArrayItemParser(emit)
+            with client.beta.chat.completions.stream(
+                model=self.model_name,
+                messages=messages,
+                response_format=response_format,
+                stream_options={"include_usage": True}
+            ) as stream:
+                for event in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise ResponseCancelled("Response cancelled")
+                    if event.type == "content.delta":
+                        parser.feed(event.delta)
+                return stream.get_final_completion()
+
+        response = self._request(send, cancel_event, deadline, can_retry=lambda: not emitted)
+        self.update_token_usage(response)
+        return response.choices[0].message.parsed
@@ -0,0 +1,228 @@
+import asyncio
+import random
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# Running profiles that need tracemalloc; tracing is process-wide
+_active_profilers: Set["JobProfiler"] = set()
+_tracemalloc_owned = False
+_tracemalloc_lock = threading.Lock()
+# Extraction jobs running in this process, profiled or not; tracemalloc sees them all
+_running_jobs: Set[str] = set()
+
+
+def should_profile(requested: bool) -> bool:
+    """
+    Decide whether to profile a job, either on request or by sampling
+    """
+    return requested or random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def profile_stage(profiler: Optional["JobProfiler"], name: str, children: bool = False):
+    """
+    Time a pipeline stage if the job is being profiled
+    """
+    return profiler.stage(name, children) if profiler else nullcontext()
+
+
+def job_started(extraction_id: str) -> None:
+    """
+    Record that an extraction job started running in this process, so
+    profiles running at the same time know their memory figures are shared
+    """
+    with _tracemalloc_lock:
+        _running_jobs.add(extraction_id)
+        for profiler in _active_profilers:
+            if profiler.extraction_id != extraction_id:
+                profiler._shared_peak = True
+
+
+def job_finished(extraction_id: str) -> None:
+    """
+    Record that an extraction job stopped running in this process
+    """
+    with _tracemalloc_lock:
+        _running_jobs.discard(extraction_id)
+
+
+class JobProfiler:
+    """
+    Collect a profile for one extraction job: tracemalloc peak and top
+    allocation sites, CPU and wall time per pipeline stage, and intervals
+    where the event loop was blocked.
+
+    Memory and event loop figures are process-wide, so they include any
+    other jobs running at the same time, profiled or not. The report flags a
+    memory peak that may include other jobs.
+    """
+    def __init__(self, extraction_id: str):
+        self.extraction_id = extraction_id
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.blocking: List[Tuple[float, float]] = []
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_size = 0
+        self._snapshot_at = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+        self._started_at = None
+        self._started = 0.0
+        self._process_cpu = 0.0
+        # Set when another job ran at the same time as this one, or tracing
+        # was already running before it started
+        self._shared_peak = False
+
+    def start(self) -> None:
+        """
+        Start tracing; must be called from the job's event loop
+        """
+        global _tracemalloc_owned
+        with _tracemalloc_lock:
+            if not _active_profilers:
+                if tracemalloc.is_tracing():
+                    # Someone else traces; resetting their peak would corrupt it
+                    self._shared_peak = True
+                else:
+                    # Tracing stops with the last profile, so the peak starts fresh here
+                    tracemalloc.start()
+                    _tracemalloc_owned = True
+            else:
+                # Profiles running already share the peak from here on
+                for profiler in _active_profilers:
+                    profiler._shared_peak = True
+            if _running_jobs - {self.extraction_id}:
+                self._shared_peak = True
+            _active_profilers.add(self)
+
+        self._started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._process_cpu = time.process_time()
+        self._monitor = asyncio.create_task(self._watch_event_loop())
+
+    @staticmethod
+    def _children_cpu() -> float:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    @contextmanager
+    def stage(self, name: str, children: bool = False):
+        """
+        Record CPU time of the calling thread and wall time spent in a stage.
+        Stages may nest, e.g. question parsing happens during the LLM request.
+
+        With `children`, CPU time of child processes that exit during the stage
+        (e.g. pdftoppm) is recorded too; it is process-wide, so it includes
+        children of other jobs finishing at the same time.
+        """
+        cpu = time.thread_time()
+        children_cpu = self._children_cpu() if children else 0.0
+        wall = time.perf_counter()
+        try:
+            yield
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            if children:
+                children_cpu = self._children_cpu() - children_cpu
+            with self._lock:
+                stage = self.stages.setdefault(
+                    name, {"calls": 0, "cpu_seconds": 0.0, "wall_seconds": 0.0}
+                )
+                stage["calls"] += 1
+                stage["cpu_seconds"] += cpu
+                stage["wall_seconds"] += wall
+                if children:
+                    stage["child_cpu_seconds"] = stage.get("child_cpu_seconds", 0.0) + children_cpu
+
+    def sample_memory(self, force: bool = False) -> None:
+        """
+        Keep a snapshot of allocation sites if more memory is traced than at
+        the last sample, so the report reflects the job's high-water mark.
+
+        Snapshots walk every traced allocation, so call this from worker
+        threads rather than the event loop. Unless `force` is set, at most one
+        snapshot is taken per PROFILE_MEMORY_SAMPLE_SECONDS, and threads that
+        find a snapshot in progress skip their sample.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        if not self._snapshot_lock.acquire(blocking=force):
+            return
+        try:
+            current, _ = tracemalloc.get_traced_memory()
+            due = time.monotonic() - self._snapshot_at >= settings.PROFILE_MEMORY_SAMPLE_SECONDS
+            if current > self._snapshot_size and (force or due):
+                self._snapshot = tracemalloc.take_snapshot()
+                self._snapshot_size = current
+                self._snapshot_at = time.monotonic()
+        finally:
+            self._snapshot_lock.release()
+
+    async def _watch_event_loop(self) -> None:
+        interval = settings.PROFILE_LOOP_CHECK_SECONDS
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - before - interval
+            if lag >= settings.PROFILE_BLOCK_THRESHOLD_SECONDS:
+                self.blocking.append((before + interval - self._started, lag))
+
+    def stop(self) -> Dict[str, Any]:
+        """
+        Stop tracing and build the profile report
+        """
+        global _tracemalloc_owned
+        if self._monitor:
+            self._monitor.cancel()
+
+        # Samples are taken by the page threads; only very short jobs need one here
+        if self._snapshot is None:
+            self.sample_memory(force=True)
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        top_allocations = []
+        if self._snapshot:
+            top_allocations = [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in self._snapshot.statistics("lineno")[:settings.PROFILE_TOP_ALLOCATIONS]
+            ]
+
+        with _tracemalloc_lock:
+            _active_profilers.discard(self)
+            shared_peak = self._shared_peak
+            if not _active_profilers and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+
+        longest = sorted(self.blocking, key=lambda interval: interval[1], reverse=True)
+        return {
+            "extraction_id": self.extraction_id,
+            "started_at": self._started_at.isoformat() if self._started_at else None,
+            "wall_seconds": time.perf_counter() - self._started,
+            "process_cpu_seconds": time.process_time() - self._process_cpu,
+            "memory": {
+                "peak_bytes": peak,
+                "peak_includes_other_jobs": shared_peak,
+                "top_allocations": top_allocations,
+            },
+            "stages": self.stages,
+            "event_loop_blocking": {
+                "threshold_seconds": settings.PROFILE_BLOCK_THRESHOLD_SECONDS,
+                "count": len(self.blocking),
+                "total_seconds": sum(lag for _, lag in self.blocking),
+                "intervals": [
+                    {"offset_seconds": offset, "duration_seconds": lag}
+                    for offset, lag in longest[:settings.PROFILE_TOP_BLOCKING_INTERVALS]
+                ],
+            },
+        }
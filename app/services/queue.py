@@ -0,0 +1,510 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Type
+
+from app.core.config import settings
+from app.utils.file_handler import clean_up_files
+
+
+class QueuedJob:
+    """
+    An extraction job as stored in the shared job queue
+    """
+    def __init__(
+        self,
+        extraction_id: str,
+        file_path: str,
+        api_key: Optional[str] = None,
+        status: str = "pending",
+        message: str = "Waiting for a worker",
+        progress: float = 0.0,
+        skipped_pages: Optional[List[int]] = None,
+        error: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        attempts: int = 0,
+        cancel_requested: bool = False,
+        profile: bool = False,
+        key_fingerprint: Optional[str] = None,
+    ):
+        self.extraction_id = extraction_id
+        self.file_path = file_path
+        # Only set when the caller brought their own key; workers fall back to their
+        # env key. Backends must drop it once the job reaches a final state.
+        self.api_key = api_key
+        self.status = status
+        self.message = message
+        self.progress = progress
+        self.skipped_pages = skipped_pages or []
+        self.error = error
+        self.worker_id = worker_id
+        self.attempts = attempts
+        self.cancel_requested = cancel_requested
+        self.profile = profile
+        # Fingerprint of the key the job runs under (see scheduler.key_fingerprint),
+        # kept after the key itself is dropped so claims can be shared fairly
+        self.key_fingerprint = key_fingerprint
+
+
+class JobQueue(ABC):
+    """
+    Durable queue shared between the API and extraction workers.
+
+    Claimed jobs hold a lease that workers renew through heartbeat(); a job
+    whose lease expires (e.g. its worker crashed) can be claimed again. The
+    queue also holds the state workers must agree on: daily token usage per
+    key and the set of live workers that split the rate limits.
+    """
+
+    @abstractmethod
+    def enqueue(self, job: QueuedJob) -> None:
+        """
+        Add a new pending job
+        """
+
+    @abstractmethod
+    def get(self, extraction_id: str) -> Optional[QueuedJob]:
+        """
+        Get a job by extraction ID
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        """
+        Claim a pending or expired job, returns None if there is none. Keys
+        share workers fairly: the job is the oldest one of the key with the
+        fewest running jobs (relative to its weight). Expired jobs out of
+        attempts are failed and their uploads removed.
+        """
+
+    @abstractmethod
+    def heartbeat(
+        self,
+        extraction_id: str,
+        worker_id: str,
+        lease_seconds: float,
+        message: str,
+        progress: float,
+        skipped_pages: List[int],
+    ) -> bool:
+        """
+        Renew the lease and report progress. Returns False if the worker lost
+        the lease or cancellation was requested, so it should stop the job.
+        """
+
+    @abstractmethod
+    def finish(
+        self,
+        extraction_id: str,
+        worker_id: str,
+        status: str,
+        message: str,
+        error: Optional[str] = None,
+        skipped_pages: Optional[List[int]] = None,
+    ) -> None:
+        """
+        Record the final state of a job claimed by `worker_id`
+        """
+
+    @abstractmethod
+    def release(self, extraction_id: str, worker_id: str) -> None:
+        """
+        Give a claimed job back to the queue without counting the attempt
+        """
+
+    @abstractmethod
+    def cancel(self, extraction_id: str) -> Optional[QueuedJob]:
+        """
+        Cancel a pending job and remove its upload, or ask the worker running
+        it to stop (the worker then removes the upload)
+        """
+
+    @abstractmethod
+    def add_usage(self, fingerprint: str, day: str, tokens: int) -> int:
+        """
+        Add tokens used by a key on a (UTC, ISO format) day, returns the day's total
+        """
+
+    @abstractmethod
+    def get_usage(self, fingerprint: str, day: str) -> int:
+        """
+        Get the tokens used by a key on a day
+        """
+
+    @abstractmethod
+    def register_worker(self, worker_id: str, ttl_seconds: float) -> int:
+        """
+        Mark a worker alive for `ttl_seconds`, returns the number of live workers
+        """
+
+    @abstractmethod
+    def unregister_worker(self, worker_id: str) -> None:
+        """
+        Remove a worker that is shutting down
+        """
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue stored in a SQLite database, suitable for workers on a single
+    host sharing a volume
+    """
+    def __init__(self, path: str, max_attempts: int = 3, weights: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.weights = weights or {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    extraction_id TEXT PRIMARY KEY,
+                    file_path TEXT NOT NULL,
+                    api_key TEXT,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    skipped_pages TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    profile INTEGER NOT NULL DEFAULT 0,
+                    key_fingerprint TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS usage (
+                    fingerprint TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (fingerprint, day)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            # Databases created before job profiling and fair claims were added
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "profile" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN profile INTEGER NOT NULL DEFAULT 0")
+            if "key_fingerprint" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN key_fingerprint TEXT")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit mode; write transactions are opened explicitly where needed
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> QueuedJob:
+        return QueuedJob(
+            extraction_id=row["extraction_id"],
+            file_path=row["file_path"],
+            api_key=row["api_key"],
+            status=row["status"],
+            message=row["message"],
+            progress=row["progress"],
+            skipped_pages=json.loads(row["skipped_pages"]),
+            error=row["error"],
+            worker_id=row["worker_id"],
+            attempts=row["attempts"],
+            cancel_requested=bool(row["cancel_requested"]),
+            profile=bool(row["profile"]),
+            key_fingerprint=row["key_fingerprint"],
+        )
+
+    def enqueue(self, job: QueuedJob) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (extraction_id, file_path, api_key, status, message,
+                                  progress, profile, key_fingerprint, created_at, updated_at)
+                VALUES (?, ?, ?, 'pending', ?, 0, ?, ?, ?, ?)
+                """,
+                (job.extraction_id, job.file_path, job.api_key, job.message, int(job.profile),
+                 job.key_fingerprint, now, now),
+            )
+
+    def get(self, extraction_id: str) -> Optional[QueuedJob]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE extraction_id = ?", (extraction_id,)
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock up front so two workers cannot claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker stopped heartbeating have used up their attempts
+                lost = conn.execute(
+                    """
+                    SELECT file_path FROM jobs
+                    WHERE status = 'in_progress' AND lease_expires_at < ? AND attempts >= ?
+                    """,
+                    (now, self.max_attempts),
+                ).fetchall()
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', worker_id = NULL, api_key = NULL, updated_at = ?,
+                        message = 'Extraction failed: worker lost too many times',
+                        error = 'worker lost too many times'
+                    WHERE status = 'in_progress' AND lease_expires_at < ? AND attempts >= ?
+                    """,
+                    (now, now, self.max_attempts),
+                )
+                running = {
+                    running_row["fingerprint"]: running_row["jobs"]
+                    for running_row in conn.execute(
+                        """
+                        SELECT COALESCE(key_fingerprint, '') AS fingerprint, COUNT(*) AS jobs
+                        FROM jobs
+                        WHERE status = 'in_progress' AND lease_expires_at >= ?
+                        GROUP BY fingerprint
+                        """,
+                        (now,),
+                    )
+                }
+                # Oldest claimable job of each key (SQLite returns the row holding the MIN)
+                candidates = conn.execute(
+                    """
+                    SELECT *, COALESCE(key_fingerprint, '') AS fingerprint, MIN(created_at)
+                    FROM jobs
+                    WHERE cancel_requested = 0
+                      AND (status = 'pending' OR (status = 'in_progress' AND lease_expires_at < ?))
+                    GROUP BY fingerprint
+                    """,
+                    (now,),
+                ).fetchall()
+                row = min(
+                    candidates,
+                    key=lambda candidate: (
+                        running.get(candidate["fingerprint"], 0)
+                        / self.weights.get(candidate["fingerprint"], 1.0),
+                        candidate["created_at"],
+                    ),
+                    default=None,
+                )
+                if row is not None:
+                    conn.execute(
+                        """
+                        UPDATE jobs SET status = 'in_progress', worker_id = ?, lease_expires_at = ?,
+                            attempts = attempts + 1, message = 'Extraction started', updated_at = ?
+                        WHERE extraction_id = ?
+                        """,
+                        (worker_id, now + lease_seconds, now, row["extraction_id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        for lost_job in lost:
+            clean_up_files(lost_job["file_path"])
+
+        if row is None:
+            return None
+        job = self._to_job(row)
+        job.status = "in_progress"
+        job.worker_id = worker_id
+        job.attempts += 1
+        return job
+
+    def heartbeat(
+        self,
+        extraction_id: str,
+        worker_id: str,
+        lease_seconds: float,
+        message: str,
+        progress: float,
+        skipped_pages: List[int],
+    ) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                """
+                UPDATE jobs SET lease_expires_at = ?, message = ?, progress = ?,
+                    skipped_pages = ?, updated_at = ?
+                WHERE extraction_id = ? AND worker_id = ? AND status = 'in_progress'
+                  AND cancel_requested = 0
+                """,
+                (now + lease_seconds, message, progress, json.dumps(skipped_pages), now,
+                 extraction_id, worker_id),
+            ).rowcount
+        return updated == 1
+
+    def finish(
+        self,
+        extraction_id: str,
+        worker_id: str,
+        status: str,
+        message: str,
+        error: Optional[str] = None,
+        skipped_pages: Optional[List[int]] = None,
+    ) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = ?, message = ?, error = ?, skipped_pages = ?,
+                    progress = CASE WHEN ? = 'completed' THEN 1.0 ELSE progress END,
+                    lease_expires_at = NULL, api_key = NULL, updated_at = ?
+                WHERE extraction_id = ? AND worker_id = ?
+                """,
+                (status, message, error, json.dumps(skipped_pages or []), status, now,
+                 extraction_id, worker_id),
+            )
+
+    def release(self, extraction_id: str, worker_id: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'pending', worker_id = NULL, lease_expires_at = NULL,
+                    attempts = MAX(attempts - 1, 0), message = 'Waiting for a worker',
+                    progress = 0, skipped_pages = '[]', updated_at = ?
+                WHERE extraction_id = ? AND worker_id = ? AND status = 'in_progress'
+                """,
+                (now, extraction_id, worker_id),
+            )
+
+    def cancel(self, extraction_id: str) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT status, file_path FROM jobs WHERE extraction_id = ?", (extraction_id,)
+                ).fetchone()
+                conn.execute(
+                    """
+                    UPDATE jobs SET cancel_requested = 1, message = 'Extraction cancelled',
+                        status = 'cancelled', api_key = NULL, updated_at = ?
+                    WHERE extraction_id = ? AND status IN ('pending', 'in_progress')
+                    """,
+                    (now, extraction_id),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        # No worker will pick up a cancelled pending job, so remove its upload here
+        if row is not None and row["status"] == "pending":
+            clean_up_files(row["file_path"])
+        return self.get(extraction_id)
+
+    def add_usage(self, fingerprint: str, day: str, tokens: int) -> int:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO usage (fingerprint, day, tokens) VALUES (?, ?, ?)
+                    ON CONFLICT (fingerprint, day) DO UPDATE SET tokens = tokens + excluded.tokens
+                    """,
+                    (fingerprint, day, tokens),
+                )
+                total = conn.execute(
+                    "SELECT tokens FROM usage WHERE fingerprint = ? AND day = ?", (fingerprint, day)
+                ).fetchone()["tokens"]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return total
+
+    def get_usage(self, fingerprint: str, day: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT tokens FROM usage WHERE fingerprint = ? AND day = ?", (fingerprint, day)
+            ).fetchone()
+        return row["tokens"] if row else 0
+
+    def register_worker(self, worker_id: str, ttl_seconds: float) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO workers (worker_id, expires_at) VALUES (?, ?)
+                    ON CONFLICT (worker_id) DO UPDATE SET expires_at = excluded.expires_at
+                    """,
+                    (worker_id, now + ttl_seconds),
+                )
+                # Workers that crashed stop counting once their entry expires
+                conn.execute("DELETE FROM workers WHERE expires_at < ?", (now,))
+                count = conn.execute("SELECT COUNT(*) AS workers FROM workers").fetchone()["workers"]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+
+# Available queue backends, keyed by JOB_QUEUE_BACKEND
+QUEUE_BACKENDS: Dict[str, Type[JobQueue]] = {
+    "sqlite": SQLiteJobQueue,
+}
+
+
+def register_queue_backend(name: str, backend: Type[JobQueue]) -> None:
+    """
+    Register an additional job queue backend
+    """
+    QUEUE_BACKENDS[name] = backend
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the job queue configured in settings, created once per process.
+    Its methods block, so call them through asyncio.to_thread from async code.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            backend = QUEUE_BACKENDS.get(settings.JOB_QUEUE_BACKEND)
+            if backend is None:
+                raise ValueError(f"Unknown job queue backend: {settings.JOB_QUEUE_BACKEND}")
+            _job_queue = backend(
+                settings.JOB_QUEUE_PATH,
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+                weights=settings.TENANT_WEIGHTS,
+            )
+        return _job_queue
@@ -0,0 +1,463 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.queue import JobQueue
+
+
+class TokenBudgetExceeded(Exception):
+    """
+    Raised when a page would push an API key past its daily token budget
+    """
+
+
+class PageTimeout(asyncio.TimeoutError):
+    """
+    Raised when a scheduled job runs past its own timeout
+    """
+
+
+def key_fingerprint(api_key: str) -> str:
+    """
+    Get a short, non-reversible identifier for an API key
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket used for requests/tokens per minute limits.
+    The balance may go negative when actual usage exceeds what was reserved.
+    """
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.balance = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.balance = min(self.capacity, self.balance + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` can be taken (0 if available now)
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.balance >= amount:
+            return 0.0
+        return (amount - self.balance) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill(time.monotonic())
+        self.balance -= amount
+
+    def give(self, amount: float) -> None:
+        self._refill(time.monotonic())
+        self.balance = min(self.capacity, self.balance + amount)
+
+    def resize(self, per_minute: float) -> None:
+        self._refill(time.monotonic())
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.balance = min(self.capacity, self.balance)
+
+
+class _Job:
+    def __init__(self, func: Callable, args: Tuple, kwargs: Dict[str, Any],
+                 estimated_tokens: int, timeout: Optional[float],
+                 cancel_event: Optional[threading.Event]):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.estimated_tokens = estimated_tokens
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        # Set from the job's thread once it reports usage through record_usage
+        self.usage_recorded = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class _Flow:
+    """
+    Queue of pages submitted by one caller (e.g. one extraction) under a key
+    """
+    def __init__(self, start_tag: float):
+        self.queue: Deque[_Job] = deque()
+        self.start_tag = start_tag
+
+
+class _Tenant:
+    """
+    Flows, limits and usage for a single API key
+    """
+    def __init__(self, fingerprint: str, weight: float, rpm: float, tpm: float,
+                 daily_budget: Optional[int]):
+        self.fingerprint = fingerprint
+        self.weight = weight
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.daily_budget = daily_budget
+        self.flows: Dict[str, _Flow] = {}
+        # Start-time fair queueing tags among keys, and the key's own
+        # virtual time for fair queueing among its flows
+        self.start_tag = 0.0
+        self.finish_tag = 0.0
+        self.flow_virtual_time = 0.0
+        self.reserved_tokens = 0
+        self.used_tokens = 0
+        self.usage_day = self._today()
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def roll_day(self) -> None:
+        today = self._today()
+        if today != self.usage_day:
+            self.usage_day = today
+            self.used_tokens = 0
+
+    def over_budget(self, estimated_tokens: int) -> bool:
+        if self.daily_budget is None:
+            return False
+        self.roll_day()
+        return self.used_tokens + self.reserved_tokens + estimated_tokens > self.daily_budget
+
+    def wait_time(self, estimated_tokens: int, now: float) -> float:
+        return max(
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(estimated_tokens, now),
+        )
+
+    def next_flow(self) -> Optional[_Flow]:
+        """
+        Get the backlogged flow with the smallest start tag, dropping work
+        whose caller has gone away and flows that ran empty
+        """
+        best = None
+        for flow_id in list(self.flows):
+            flow = self.flows[flow_id]
+            while flow.queue and flow.queue[0].future.done():
+                flow.queue.popleft()
+            if not flow.queue:
+                del self.flows[flow_id]
+            elif best is None or flow.start_tag < best.start_tag:
+                best = flow
+        return best
+
+    def pop(self, flow: _Flow) -> _Job:
+        """
+        Take the next job of `flow`, advancing the flow and key tags by one page
+        """
+        self.flow_virtual_time = flow.start_tag
+        flow.start_tag += 1.0
+        self.finish_tag = self.start_tag + 1.0 / self.weight
+        self.start_tag = self.finish_tag
+        return flow.queue.popleft()
+
+
+class FairScheduler:
+    """
+    Schedule page-level work across API keys.
+
+    Fair queueing is two-level: keys share the workers by start-time fair
+    queueing, with optional weights per key, and within a key each flow (one
+    extraction job) gets an equal share, so a small job submitted with the
+    shared env key is not stuck behind a large one. Dispatch also honours
+    per-key requests/tokens per minute limits and daily token budgets. Work
+    functions are blocking and run in threads.
+
+    When several processes share the keys (queue workers), `usage_store`
+    keeps daily usage in the shared job queue and set_rate_share() splits the
+    per-minute limits between the processes.
+    """
+    def __init__(
+        self,
+        max_concurrency: int,
+        rpm: int,
+        tpm: int,
+        daily_budget: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        daily_budgets: Optional[Dict[str, int]] = None,
+        usage_store: Optional[JobQueue] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.daily_budget = daily_budget
+        self.weights = weights or {}
+        self.daily_budgets = daily_budgets or {}
+        self.usage_store = usage_store
+        self.rate_share = 1
+
+        self._tenants: Dict[str, _Tenant] = {}
+        self._virtual_time = 0.0
+        self._active = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Job run by the current executor thread
+        self._current = threading.local()
+
+    def _tenant(self, api_key: str) -> _Tenant:
+        fingerprint = key_fingerprint(api_key)
+        tenant = self._tenants.get(fingerprint)
+        if tenant is None:
+            tenant = _Tenant(
+                fingerprint,
+                weight=self.weights.get(fingerprint, 1.0),
+                rpm=self.rpm / self.rate_share,
+                tpm=self.tpm / self.rate_share,
+                daily_budget=self.daily_budgets.get(fingerprint, self.daily_budget),
+            )
+            self._tenants[fingerprint] = tenant
+        return tenant
+
+    def set_rate_share(self, processes: int) -> None:
+        """
+        Split the per-key RPM/TPM limits evenly between `processes` processes
+        sharing the keys
+        """
+        self.rate_share = max(processes, 1)
+        for tenant in self._tenants.values():
+            tenant.requests.resize(self.rpm / self.rate_share)
+            tenant.tokens.resize(self.tpm / self.rate_share)
+
+    def record_usage(self, api_key: str, prompt_tokens: int, completion_tokens: int) -> None:
+        """
+        Account tokens actually consumed by a request made with `api_key`.
+        Safe to call from the worker threads running scheduled jobs, where
+        the usage is also written to the usage store.
+        """
+        tokens = prompt_tokens + completion_tokens
+        job = getattr(self._current, "job", None)
+        if job is not None:
+            job.usage_recorded = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._record_usage, api_key, tokens)
+        else:
+            self._record_usage(api_key, tokens)
+
+        if self.usage_store is not None:
+            if loop is None:
+                self._store_usage(api_key, tokens)
+            else:
+                # The store blocks, keep it off the event loop
+                loop.run_in_executor(None, self._store_usage, api_key, tokens)
+
+    def _record_usage(self, api_key: str, tokens: int) -> None:
+        tenant = self._tenant(api_key)
+        tenant.roll_day()
+        tenant.used_tokens += tokens
+        tenant.tokens.take(tokens)
+
+    def _store_usage(self, api_key: str, tokens: int) -> None:
+        fingerprint = key_fingerprint(api_key)
+        day = _Tenant._today()
+        try:
+            total = self.usage_store.add_usage(fingerprint, day.isoformat(), tokens)
+        except Exception as e:
+            print(f"Failed to record token usage: {str(e)}")
+            return
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._sync_usage, fingerprint, day, total)
+        else:
+            self._sync_usage(fingerprint, day, total)
+
+    def _sync_usage(self, fingerprint: str, day, total: int) -> None:
+        # Totals only grow within a day and include this process's own usage
+        tenant = self._tenants.get(fingerprint)
+        if tenant is None:
+            return
+        tenant.roll_day()
+        if day == tenant.usage_day:
+            tenant.used_tokens = max(tenant.used_tokens, total)
+
+    def _charge(self, tenant: _Tenant, tokens: int) -> None:
+        """
+        Count tokens against a key's daily budget without refunding them to
+        its TPM bucket, for requests cut off before they reported usage
+        """
+        tenant.roll_day()
+        tenant.used_tokens += tokens
+        if self.usage_store is not None:
+            fingerprint, day = tenant.fingerprint, _Tenant._today()
+
+            def store() -> None:
+                try:
+                    self.usage_store.add_usage(fingerprint, day.isoformat(), tokens)
+                except Exception as e:
+                    print(f"Failed to record token usage: {str(e)}")
+
+            self._loop.run_in_executor(None, store)
+
+    async def run(self, api_key: str, func: Callable, *args,
+                  flow: str = "default",
+                  estimated_tokens: Optional[int] = None,
+                  timeout: Optional[float] = None,
+                  cancel_event: Optional[threading.Event] = None, **kwargs) -> Any:
+        """
+        Queue `func(*args, **kwargs)` under the tenant owning `api_key`, in
+        the flow named `flow`, and wait for its result. `timeout` bounds the
+        run time once dispatched (not the time spent queued) and raises
+        PageTimeout.
+
+        A running thread cannot be interrupted: on timeout or cancellation
+        `cancel_event` is set so `func` can stop early, and the worker slot
+        stays taken until `func` returns.
+        """
+        if estimated_tokens is None:
+            estimated_tokens = settings.ESTIMATED_TOKENS_PER_PAGE
+        tenant = self._tenant(api_key)
+        self._ensure_dispatcher()
+
+        if self.usage_store is not None and tenant.daily_budget is not None:
+            # Pick up usage from other processes (and from before a restart)
+            day = _Tenant._today()
+            total = await asyncio.to_thread(
+                self.usage_store.get_usage, tenant.fingerprint, day.isoformat()
+            )
+            self._sync_usage(tenant.fingerprint, day, total)
+
+        # Start-time fair queueing: a key or flow that becomes backlogged
+        # starts at the current virtual time, each page costs 1 (1 / weight
+        # across keys)
+        if tenant.next_flow() is None:
+            tenant.start_tag = max(self._virtual_time, tenant.finish_tag)
+        if flow not in tenant.flows:
+            tenant.flows[flow] = _Flow(tenant.flow_virtual_time)
+        job = _Job(func, args, kwargs, estimated_tokens, timeout, cancel_event)
+        tenant.flows[flow].queue.append(job)
+
+        self._wakeup.set()
+        return await job.future
+
+    def _ensure_dispatcher(self) -> None:
+        if self._wakeup is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            # Own threads, so slow pages cannot starve other to_thread users
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="scheduler"
+            )
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    def _pick(self) -> Tuple[Optional[_Tenant], Optional[float]]:
+        """
+        Get the ready tenant with the smallest start tag, or the time until
+        a rate-limited tenant becomes ready
+        """
+        now = time.monotonic()
+        best = None
+        delay = None
+        for tenant in self._tenants.values():
+            flow = tenant.next_flow()
+            while flow and tenant.over_budget(flow.queue[0].estimated_tokens):
+                flow.queue.popleft().future.set_exception(TokenBudgetExceeded(
+                    f"Daily token budget of {tenant.daily_budget} exhausted for key {tenant.fingerprint}"
+                ))
+                flow = tenant.next_flow()
+            if flow is None:
+                continue
+
+            wait = tenant.wait_time(flow.queue[0].estimated_tokens, now)
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+            elif best is None or tenant.start_tag < best.start_tag:
+                best = tenant
+        return best, delay
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = None
+            while self._active < self.max_concurrency:
+                tenant, delay = self._pick()
+                if tenant is None:
+                    break
+                self._virtual_time = max(self._virtual_time, tenant.start_tag)
+                self._start(tenant, tenant.pop(tenant.next_flow()))
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, tenant: _Tenant, job: _Job) -> None:
+        # Reserve the estimate up front; it is returned once the job finishes
+        # and the actual usage has been recorded through record_usage
+        self._active += 1
+        tenant.requests.take(1)
+        tenant.tokens.take(job.estimated_tokens)
+        tenant.reserved_tokens += job.estimated_tokens
+        asyncio.create_task(self._execute(tenant, job))
+
+    def _call(self, job: _Job) -> Any:
+        self._current.job = job
+        try:
+            return job.func(*job.args, **job.kwargs)
+        finally:
+            self._current.job = None
+
+    async def _execute(self, tenant: _Tenant, job: _Job) -> None:
+        work = self._loop.run_in_executor(self._executor, self._call, job)
+        abandoned = False
+        # Make sure the failure of an abandoned job is not reported as unhandled
+        work.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            # Answer the caller as soon as the job finishes or times out
+            await asyncio.wait(
+                {work, job.future}, timeout=job.timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not job.future.done():
+                if not work.done():
+                    job.future.set_exception(PageTimeout(
+                        f"Job did not finish within {job.timeout} seconds"
+                    ))
+                elif work.exception() is not None:
+                    job.future.set_exception(work.exception())
+                else:
+                    job.future.set_result(work.result())
+
+            if not work.done():
+                # Timed out or cancelled by the caller: ask the job to stop
+                # and keep its slot until the thread has actually returned
+                abandoned = True
+                if job.cancel_event:
+                    job.cancel_event.set()
+                await asyncio.wait({work})
+        finally:
+            self._active -= 1
+            tenant.reserved_tokens -= job.estimated_tokens
+            if abandoned and not job.usage_recorded:
+                # A stopped request may already have used tokens (a closed stream
+                # reports no usage), so keep the estimate charged rather than refund it
+                self._charge(tenant, job.estimated_tokens)
+            else:
+                tenant.tokens.give(job.estimated_tokens)
+            self._wakeup.set()
+
+
+# Shared scheduler for all extraction jobs in this process
+scheduler = FairScheduler(
+    max_concurrency=settings.MAX_CONCURRENT_PAGES,
+    rpm=settings.RATE_LIMIT_RPM,
+    tpm=settings.RATE_LIMIT_TPM,
+    daily_budget=settings.DAILY_TOKEN_BUDGET,
+    weights=settings.TENANT_WEIGHTS,
+    daily_budgets=settings.TENANT_DAILY_TOKEN_BUDGETS,
+)
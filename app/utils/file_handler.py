@@ -59,6 +59,22 @@ def get_output_file_path(extraction_id: str) -> str:
     return os.path.join(settings.OUTPUT_DIR, f"{extraction_id}.json")
 
 
+def get_partial_output_file_path(extraction_id: str) -> str:
+    """
+    Get the path for the questions a queued job has extracted so far
+    """
+    create_output_dir()
+    return os.path.join(settings.OUTPUT_DIR, f"{extraction_id}.partial.json")
+
+
+def get_profile_file_path(extraction_id: str) -> str:
+    """
+    Get the path for a job's profile report based on extraction ID
+    """
+    create_output_dir()
+    return os.path.join(settings.OUTPUT_DIR, f"{extraction_id}.profile.json")
+
+
 def clean_up_files(file_path: str) -> None:
     """
     Clean up temporary files after processing
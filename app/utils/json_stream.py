@@ -0,0 +1,49 @@
+import json
+from typing import Any, Callable, List
+
+
+class JSONArrayItemParser:
+    """
+    Incremental parser for streamed JSON objects of the form
+    {"field": [{...}, {...}]}.
+
+    Text is fed in arbitrary chunks; each item of a top-level array field is
+    decoded and passed to `on_item` as soon as its closing brace arrives,
+    without waiting for the rest of the document.
+    """
+    def __init__(self, on_item: Callable[[Any], None]):
+        self.on_item = on_item
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._capturing = False
+
+    def feed(self, text: str) -> None:
+        for char in text:
+            if self._capturing:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                # Depth 1 is the root object, 2 its array field, 3 an item
+                if self._depth == 3 and char == "{":
+                    self._capturing = True
+                    self._buffer = [char]
+            elif char in "}]":
+                self._depth -= 1
+                if self._capturing and self._depth == 2:
+                    self._capturing = False
+                    self.on_item(json.loads("".join(self._buffer)))
+
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import uuid
+from typing import Any, Dict, List, Set
+
+from app.core.config import settings
+from app.core.security import get_api_key_from_env
+from app.services.extractor import ExtractionTask, _run_extraction, extraction_tasks
+from app.services.profiler import JobProfiler
+from app.services.queue import JobQueue, QueuedJob, get_job_queue
+from app.services.scheduler import scheduler
+from app.utils.file_handler import clean_up_files, get_partial_output_file_path
+
+
+def _write_partial_output(path: str, questions: List[Dict[str, Any]]) -> None:
+    # Replace the file in one step so the API never reads a half-written one
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump(questions, file)
+    os.replace(f"{path}.tmp", path)
+
+
+async def _publish_partial_output(task: ExtractionTask, path: str, stop: asyncio.Event) -> None:
+    """
+    Write the questions extracted so far where the API's status endpoint can
+    read them, whenever they change, until `stop` is set
+    """
+    # None so the first pass replaces a file left by an earlier attempt at the job
+    published = None
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.WORKER_PARTIAL_OUTPUT_SECONDS)
+            break
+        except asyncio.TimeoutError:
+            pass
+        questions = task.live_questions()
+        if questions != published:
+            try:
+                await asyncio.to_thread(_write_partial_output, path, questions)
+                published = questions
+            except Exception as e:
+                print(f"Failed to publish questions of extraction {task.extraction_id}: {str(e)}")
+
+
+async def _run_job(queue: JobQueue, job: QueuedJob, worker_id: str) -> None:
+    """
+    Run a claimed job, renewing its lease until it finishes
+    """
+    file_name = os.path.basename(job.file_path).split('.')[0]
+    task = ExtractionTask(job.extraction_id, file_name)
+    extraction_tasks[job.extraction_id] = task
+    if job.profile:
+        task.profiler = JobProfiler(job.extraction_id)
+
+    try:
+        api_key = job.api_key or get_api_key_from_env()
+    except Exception as e:
+        await asyncio.to_thread(
+            queue.finish, job.extraction_id, worker_id, "failed", f"Extraction failed: {str(e)}", str(e)
+        )
+        extraction_tasks.pop(job.extraction_id, None)
+        return
+
+    # The input file is only removed once the job reaches a final state, so
+    # another worker can pick it up again if this one goes away
+    task.job = asyncio.create_task(
+        _run_extraction(api_key, job.file_path, job.extraction_id, file_name, task, cleanup=False)
+    )
+    # Streamed questions only live in this process, so publish them for the API
+    partial_output = get_partial_output_file_path(job.extraction_id)
+    stop_publishing = asyncio.Event()
+    publisher = asyncio.create_task(_publish_partial_output(task, partial_output, stop_publishing))
+    lease_lost = False
+    try:
+        while not task.job.done():
+            await asyncio.wait({task.job}, timeout=settings.JOB_HEARTBEAT_SECONDS)
+            if task.job.done():
+                break
+            alive = await asyncio.to_thread(
+                queue.heartbeat, job.extraction_id, worker_id, settings.JOB_LEASE_SECONDS,
+                task.message, task.progress, task.skipped_pages,
+            )
+            if not alive:
+                # Either cancelled through the API or the lease went to another worker
+                current = await asyncio.to_thread(queue.get, job.extraction_id)
+                lease_lost = not (current and current.cancel_requested)
+                task.job.cancel()
+                await asyncio.wait({task.job})
+    except asyncio.CancelledError:
+        # Worker is shutting down: stop the job and hand it back to the queue
+        task.job.cancel()
+        await asyncio.wait({task.job})
+        await asyncio.to_thread(queue.release, job.extraction_id, worker_id)
+        raise
+    finally:
+        # Let a write in progress finish so it cannot recreate the file after cleanup
+        stop_publishing.set()
+        await asyncio.gather(publisher, return_exceptions=True)
+        extraction_tasks.pop(job.extraction_id, None)
+
+    if lease_lost:
+        # The partial output now belongs to the worker that took the job over
+        print(f"Lost lease on extraction {job.extraction_id}, leaving it to another worker")
+        return
+
+    await asyncio.to_thread(
+        queue.finish, job.extraction_id, worker_id, task.status, task.message,
+        task.error, task.skipped_pages,
+    )
+    clean_up_files(job.file_path)
+    clean_up_files(partial_output)
+    print(f"Extraction {job.extraction_id} {task.status}")
+
+
+async def _share_rate_limits(queue: JobQueue, worker_id: str) -> None:
+    """
+    Keep this worker registered and its share of the per-key rate limits
+    matching the number of live workers
+    """
+    while True:
+        try:
+            workers = await asyncio.to_thread(
+                queue.register_worker, worker_id, settings.JOB_LEASE_SECONDS
+            )
+            if workers != scheduler.rate_share:
+                print(f"{workers} workers sharing the rate limits")
+            scheduler.set_rate_share(workers)
+        except Exception as e:
+            print(f"Failed to register worker {worker_id}: {str(e)}")
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+
+
+async def run_worker(worker_id: str, concurrency: int) -> None:
+    """
+    Claim jobs from the shared queue and run up to `concurrency` of them at a time
+    """
+    queue = await asyncio.to_thread(get_job_queue)
+    running: Set[asyncio.Task] = set()
+
+    # Daily budgets count the usage of every worker and survive restarts
+    scheduler.usage_store = queue
+    # Register before claiming so the first jobs already use this worker's share
+    scheduler.set_rate_share(await asyncio.to_thread(
+        queue.register_worker, worker_id, settings.JOB_LEASE_SECONDS
+    ))
+    registration = asyncio.create_task(_share_rate_limits(queue, worker_id))
+
+    # Stop gracefully on SIGTERM/SIGINT so in-flight jobs are released
+    main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, main_task.cancel)
+
+    print(f"Worker {worker_id} started with concurrency {concurrency}")
+    try:
+        while True:
+            if len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id, settings.JOB_LEASE_SECONDS)
+                if job:
+                    print(f"Claimed extraction {job.extraction_id} (attempt {job.attempts})")
+                    job_task = asyncio.create_task(_run_job(queue, job, worker_id))
+                    running.add(job_task)
+                    job_task.add_done_callback(running.discard)
+                    continue
+            await asyncio.sleep(settings.WORKER_POLL_SECONDS)
+    except asyncio.CancelledError:
+        print(f"Worker {worker_id} shutting down")
+    finally:
+        for job_task in list(running):
+            job_task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        registration.cancel()
+        await asyncio.to_thread(queue.unregister_worker, worker_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run an extraction worker")
+    parser.add_argument(
+        "--worker-id",
+        default=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}",
+        help="Unique name for this worker",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.WORKER_CONCURRENCY,
+        help="Number of jobs to run at a time",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
+    asyncio.run(run_worker(args.worker_id, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
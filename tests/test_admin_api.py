@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.api.dependencies.auth import validate_admin_token
+from app.api.endpoints.admin import get_extraction_profile
+from app.core.config import settings
+from app.utils import file_handler
+
+
+def credentials(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_admin_api_is_disabled_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", None)
+    # The regular API token does not open the admin API
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(validate_admin_token(credentials(settings.API_TOKEN)))
+    assert error.value.status_code == 503
+
+
+def test_admin_api_rejects_wrong_token(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", "admin-secret")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(validate_admin_token(credentials("wrong")))
+    assert error.value.status_code == 401
+    assert asyncio.run(validate_admin_token(credentials("admin-secret")))
+
+
+def test_get_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OUTPUT_DIR", str(tmp_path))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_extraction_profile("missing", True))
+    assert error.value.status_code == 404
+
+    report = {
+        "extraction_id": "job",
+        "started_at": "2026-01-01T00:00:00+00:00",
+        "wall_seconds": 2.0,
+        "process_cpu_seconds": 1.0,
+        "memory": {"peak_bytes": 1024, "peak_includes_other_jobs": True, "top_allocations": []},
+        "stages": {
+            "rasterize": {"calls": 1, "cpu_seconds": 0.01, "wall_seconds": 1.0, "child_cpu_seconds": 0.9},
+        },
+        "event_loop_blocking": {"threshold_seconds": 0.1, "count": 0, "total_seconds": 0.0, "intervals": []},
+    }
+    with open(file_handler.get_profile_file_path("job"), 'w') as file:
+        json.dump(report, file)
+
+    profile = asyncio.run(get_extraction_profile("job", True))
+    assert profile.memory.peak_includes_other_jobs
+    assert profile.stages["rasterize"].child_cpu_seconds == 0.9
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+
+from app import cli
+from app.cli import find_documents, load_checkpoint, load_completed_jsonl, truncate_torn_line
+
+
+def test_colliding_document_ids_get_suffixes(tmp_path):
+    for name in ("a b.pdf", "a_b.pdf", "A_B.pdf"):
+        (tmp_path / name).write_bytes(b"%PDF")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "x.pdf").write_bytes(b"%PDF")
+
+    documents = find_documents(str(tmp_path), manifest=False)
+    ids = [document_id for document_id, _ in documents]
+    assert ids == ["A_B", "a_b-2", "a_b-3", "sub_x"]
+    # The same listing gives the same IDs, so a resumed run finds its outputs
+    assert find_documents(str(tmp_path), manifest=False) == documents
+
+
+def test_manifest_ids_do_not_change_when_it_grows(tmp_path):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("docs/a.pdf\n# comment\n\ndocs/b.pdf\n")
+    before = find_documents(str(manifest), manifest=True)
+    assert [document_id for document_id, _ in before] == ["docs_a", "docs_b"]
+
+    # A PDF from another directory must not shift the IDs of resumable documents
+    manifest.write_text("docs/a.pdf\ndocs/b.pdf\nother/c.pdf\n")
+    assert find_documents(str(manifest), manifest=True)[:2] == before
+
+
+def test_checkpoint_skips_torn_last_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli.settings, "OUTPUT_DIR", str(tmp_path))
+    (tmp_path / "doc.pages.jsonl").write_text(
+        json.dumps({"page": 0, "questions": [{"q": 1}]}) + "\n"
+        + json.dumps({"page": 2, "questions": []}) + "\n"
+        + '{"page": 3, "questi'
+    )
+
+    assert load_checkpoint("doc") == {0: [{"q": 1}], 2: []}
+    assert load_checkpoint("missing") == {}
+
+
+def test_resumed_jsonl_drops_torn_line_before_appending(tmp_path):
+    jsonl = tmp_path / "results.jsonl"
+    jsonl.write_text(json.dumps({"document": "a", "questions": []}) + "\n" + '{"document": "b", "que')
+
+    truncate_torn_line(str(jsonl))
+    with open(jsonl, 'a') as file:
+        file.write(json.dumps({"document": "b", "questions": []}) + "\n")
+
+    assert load_completed_jsonl(str(jsonl)) == {"a", "b"}
+    assert all(json.loads(line) for line in jsonl.read_text().splitlines())
+
+
+def test_truncate_keeps_complete_files(tmp_path):
+    jsonl = tmp_path / "results.jsonl"
+    jsonl.write_text('{"document": "a"}\n')
+    truncate_torn_line(str(jsonl))
+    assert jsonl.read_text() == '{"document": "a"}\n'
+
+    jsonl.write_text('{"document": "a"')
+    truncate_torn_line(str(jsonl))
+    assert jsonl.read_text() == ""
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+
+from app.core.config import settings
+from app.services import extractor
+from app.services.extractor import ExtractionTask, extract_pages
+from app.services.llm import ResponseCancelled
+from app.services.queue import QueuedJob
+from app.services.scheduler import FairScheduler, PageTimeout
+
+
+def fake_process_page(llm, system_prompt, page, image_path, on_question=None, profiler=None,
+                      cancel_event=None):
+    if page == "slow":
+        # Like a streamed request, stop once the scheduler gives up on the page
+        cancel_event.wait(5)
+        raise ResponseCancelled("Response cancelled")
+    return [{"question": page}]
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """
+    Run extract_pages over fake rasterized pages; set the returned list to the page contents
+    """
+    page_list = []
+    monkeypatch.setattr(extractor, "load_prompts", lambda path: {"extract_questions": {"cuet-ug": ""}})
+    monkeypatch.setattr(extractor, "LLM", lambda **kwargs: None)
+    monkeypatch.setattr(extractor, "_process_page", fake_process_page)
+    monkeypatch.setattr(
+        extractor, "_load_pdf",
+        lambda file_path, profiler=None, timeout=None, skip_pages=None: (
+            len(page_list), list(enumerate(page_list))
+        ),
+    )
+    monkeypatch.setattr(
+        extractor, "scheduler", FairScheduler(max_concurrency=4, rpm=10000, tpm=10 ** 9)
+    )
+    monkeypatch.setattr(settings, "STREAM_LLM_RESPONSES", False)
+    monkeypatch.setattr(settings, "PAGE_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(settings, "JOB_TIMEOUT_SECONDS", 10)
+    return page_list
+
+
+def run(task):
+    return asyncio.run(extract_pages("key", "doc.pdf", "doc", task))
+
+
+def test_timed_out_pages_are_skipped(pages, monkeypatch):
+    monkeypatch.setattr(settings, "SKIP_TIMED_OUT_PAGES", True)
+    pages.extend(["p1", "slow", "p3"])
+    task = ExtractionTask("job", "doc")
+
+    assert run(task) == [{"question": "p1"}, {"question": "p3"}]
+    assert task.skipped_pages == [2]
+    assert task.page_buffers == {}
+
+
+def test_page_timeout_fails_the_job_unless_skipped(pages, monkeypatch):
+    monkeypatch.setattr(settings, "SKIP_TIMED_OUT_PAGES", False)
+    pages.extend(["p1", "slow"])
+
+    with pytest.raises(PageTimeout):
+        run(ExtractionTask("job", "doc"))
+
+
+def test_job_deadline_stops_outstanding_pages(pages, monkeypatch):
+    monkeypatch.setattr(settings, "PAGE_TIMEOUT_SECONDS", 10)
+    monkeypatch.setattr(settings, "JOB_TIMEOUT_SECONDS", 0.2)
+    pages.extend(["slow", "slow"])
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError) as error:
+        run(ExtractionTask("job", "doc"))
+    assert not isinstance(error.value, PageTimeout)
+    assert "did not finish within" in str(error.value)
+    # Outstanding pages were asked to stop rather than left running to their own timeout
+    assert time.monotonic() - started < 5
+
+
+def test_job_deadline_covers_rasterization(pages, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_TIMEOUT_SECONDS", 0.1)
+
+    def slow_load_pdf(file_path, profiler=None, timeout=None, skip_pages=None):
+        time.sleep(0.5)
+        return 0, []
+
+    monkeypatch.setattr(extractor, "_load_pdf", slow_load_pdf)
+    with pytest.raises(asyncio.TimeoutError, match="did not finish within"):
+        run(ExtractionTask("job", "doc"))
+
+
+def test_rasterize_converts_runs_of_missing_pages(monkeypatch):
+    calls = []
+
+    def fake_convert(file_path, first_page=None, last_page=None, timeout=None):
+        calls.append((first_page, last_page))
+        return [f"image-{page}" for page in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(extractor, "convert_from_path", fake_convert)
+    monkeypatch.setattr(extractor, "pdfinfo_from_path", lambda file_path, timeout=None: {"Pages": 7})
+
+    total_pages, pdf_pages = extractor._rasterize("doc.pdf", timeout=10, skip_pages={0, 3, 4})
+    assert total_pages == 7
+    # Pages are 1-based for poppler and 0-based for the checkpoint
+    assert calls == [(2, 3), (6, 7)]
+    assert pdf_pages == [(1, "image-2"), (2, "image-3"), (5, "image-6"), (6, "image-7")]
+
+
+def test_queued_job_status_includes_published_questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OUTPUT_DIR", str(tmp_path))
+    (tmp_path / "job.partial.json").write_text(json.dumps([{"question": "p1"}]))
+
+    job = QueuedJob("job", "uploads/job.pdf", status="in_progress")
+    assert extractor._task_from_job(job).live_questions() == [{"question": "p1"}]
+
+    # Not yet published, or a final state without output
+    (tmp_path / "job.partial.json").unlink()
+    assert extractor._task_from_job(job).live_questions() == []
+    job.status = "failed"
+    assert extractor._task_from_job(job).questions == []
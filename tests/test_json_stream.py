@@ -0,0 +1,43 @@
+import json
+
+from app.utils.json_stream import JSONArrayItemParser
+
+
+def parse(chunks):
+    items = []
+    parser = JSONArrayItemParser(items.append)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return items
+
+
+def test_items_are_emitted_as_they_close():
+    items = []
+    parser = JSONArrayItemParser(items.append)
+    parser.feed('{"questions": [{"id": 1}, {"id"')
+    assert items == [{"id": 1}]
+
+    parser.feed(': 2}]}')
+    assert items == [{"id": 1}, {"id": 2}]
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    document = {
+        "questions": [
+            {"text": 'Solve {x | x > 0} and "quote" \\" [a]', "options": ["}", "{", "]"]},
+            {"text": "ends with a backslash \\", "nested": {"list": [{"a": 1}]}},
+        ]
+    }
+    assert parse([json.dumps(document)]) == document["questions"]
+
+
+def test_items_split_across_chunks():
+    document = {
+        "questions": [
+            {"text": 'say "hi" {not a brace}', "options": ["a", "b"]},
+            {"text": "escaped \\\\ backslash"},
+        ]
+    }
+    text = json.dumps(document)
+    # Feed one character at a time so every escape and quote is split
+    assert parse(list(text)) == document["questions"]
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from app.services.llm import LLM, ResponseCancelled
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def rate_limited(retry_after="0.05"):
+    response = httpx.Response(429, request=REQUEST, headers={"retry-after": retry_after})
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_transient_errors_are_retried():
+    llm = LLM(api_key="sk-test", timeout=5)
+    attempts = []
+
+    def send(client):
+        attempts.append(client.timeout)
+        if len(attempts) < 3:
+            raise rate_limited()
+        return "ok"
+
+    assert llm._request(send, deadline=time.monotonic() + 3) == "ok"
+    # Each attempt only gets the time left before the deadline
+    assert len(attempts) == 3 and all(timeout <= 3 for timeout in attempts)
+
+
+def test_no_retry_past_the_deadline():
+    llm = LLM(api_key="sk-test", timeout=5)
+
+    def send(client):
+        raise rate_limited(retry_after="1")
+
+    with pytest.raises(openai.RateLimitError):
+        llm._request(send, deadline=time.monotonic() + 0.5)
+
+
+def test_cancel_event_stops_the_backoff():
+    llm = LLM(api_key="sk-test", timeout=5)
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    def send(client):
+        raise rate_limited(retry_after="5")
+
+    with pytest.raises(ResponseCancelled):
+        llm._request(send, cancel_event=cancel_event)
@@ -0,0 +1,73 @@
+import asyncio
+import subprocess
+import sys
+
+from app.services.profiler import JobProfiler, job_finished, job_started
+
+
+def profile(run):
+    """
+    Run `run(profiler)` between start and stop of a profile, returns the report
+    """
+    async def main():
+        profiler = JobProfiler("profiled")
+        job_started("profiled")
+        profiler.start()
+        try:
+            run(profiler)
+        finally:
+            job_finished("profiled")
+        return profiler.stop()
+
+    return asyncio.run(main())
+
+
+def test_peak_of_a_job_running_alone_is_its_own():
+    report = profile(lambda profiler: None)
+    assert report["memory"]["peak_includes_other_jobs"] is False
+
+
+def test_peak_is_flagged_when_an_unprofiled_job_was_running():
+    job_started("unprofiled")
+    try:
+        report = profile(lambda profiler: None)
+    finally:
+        job_finished("unprofiled")
+    assert report["memory"]["peak_includes_other_jobs"] is True
+
+
+def test_peak_is_flagged_when_a_job_starts_during_the_profile():
+    def start_other_job(profiler):
+        job_started("unprofiled")
+        job_finished("unprofiled")
+
+    report = profile(start_other_job)
+    assert report["memory"]["peak_includes_other_jobs"] is True
+
+
+def test_stage_records_cpu_time_of_child_processes():
+    def rasterize(profiler):
+        with profiler.stage("rasterize", children=True):
+            subprocess.run([sys.executable, "-c", "sum(range(10 ** 7))"], check=True)
+        with profiler.stage("encode_image"):
+            pass
+
+    stages = profile(rasterize)["stages"]
+    assert stages["rasterize"]["child_cpu_seconds"] > 0.05
+    assert stages["rasterize"]["child_cpu_seconds"] > stages["rasterize"]["cpu_seconds"]
+    assert "child_cpu_seconds" not in stages["encode_image"]
+
+
+def test_memory_samples_are_rate_limited():
+    def sample(profiler):
+        data = [bytes(1000) for _ in range(1000)]
+        profiler.sample_memory()
+        first = profiler._snapshot
+        more = [bytes(1000) for _ in range(2000)]
+        profiler.sample_memory()
+        assert first is not None and profiler._snapshot is first
+        profiler.sample_memory(force=True)
+        assert profiler._snapshot is not first
+
+    report = profile(sample)
+    assert report["memory"]["top_allocations"]
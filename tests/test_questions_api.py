@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+
+from fastapi import HTTPException
+
+from app.api.endpoints.questions import cancel_extraction_task
+from app.core.config import settings
+from app.services.extractor import ExtractionTask, extraction_tasks
+
+
+@pytest.fixture(autouse=True)
+def inline_mode(monkeypatch):
+    monkeypatch.setattr(settings, "EXTRACTION_MODE", "inline")
+    yield
+    extraction_tasks.clear()
+
+
+def test_cancel_unknown_extraction_returns_404():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(cancel_extraction_task("missing", True))
+    assert error.value.status_code == 404
+
+
+def test_cancel_finished_extraction_returns_409():
+    task = ExtractionTask("done", "doc")
+    task.status = "completed"
+    extraction_tasks["done"] = task
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(cancel_extraction_task("done", True))
+    assert error.value.status_code == 409
+
+
+def test_cancel_running_extraction():
+    async def main():
+        task = ExtractionTask("running", "doc")
+        task.job = asyncio.create_task(asyncio.sleep(10))
+        extraction_tasks["running"] = task
+
+        response = await cancel_extraction_task("running", True)
+        await asyncio.gather(task.job, return_exceptions=True)
+        return response, task
+
+    response, task = asyncio.run(main())
+    assert response.status == "cancelled"
+    assert task.job.cancelled()
@@ -0,0 +1,150 @@
+import time
+
+from app.services.queue import QueuedJob, SQLiteJobQueue
+
+
+def stored_api_key(queue, extraction_id):
+    with queue._connect() as conn:
+        return conn.execute(
+            "SELECT api_key FROM jobs WHERE extraction_id = ?", (extraction_id,)
+        ).fetchone()["api_key"]
+
+
+def test_claim_returns_oldest_pending_job(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue(QueuedJob("first", "uploads/first.pdf"))
+    queue.enqueue(QueuedJob("second", "uploads/second.pdf", api_key="sk-user"))
+
+    job = queue.claim("worker-1", lease_seconds=60)
+    assert job.extraction_id == "first"
+    assert job.status == "in_progress" and job.attempts == 1
+
+    job = queue.claim("worker-1", lease_seconds=60)
+    assert job.extraction_id == "second" and job.api_key == "sk-user"
+    assert queue.claim("worker-1", lease_seconds=60) is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue(QueuedJob("job", "uploads/job.pdf"))
+
+    queue.claim("worker-1", lease_seconds=0.05)
+    assert queue.heartbeat("job", "worker-1", 0.05, "Processing", 0.5, [])
+    assert queue.claim("worker-2", lease_seconds=60) is None
+
+    time.sleep(0.1)
+    job = queue.claim("worker-2", lease_seconds=60)
+    assert job.extraction_id == "job" and job.worker_id == "worker-2" and job.attempts == 2
+
+    # The old worker lost its lease and can no longer update the job
+    assert not queue.heartbeat("job", "worker-1", 60, "Processing", 0.6, [])
+    queue.finish("job", "worker-1", "failed", "stale")
+    assert queue.get("job").status == "in_progress"
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), max_attempts=1)
+    queue.enqueue(QueuedJob("job", "uploads/job.pdf", api_key="sk-secret"))
+
+    queue.claim("worker-1", lease_seconds=0.01)
+    time.sleep(0.05)
+    assert queue.claim("worker-2", lease_seconds=60) is None
+    assert queue.get("job").status == "failed"
+    assert stored_api_key(queue, "job") is None
+
+
+def test_heartbeat_stops_cancelled_job(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue(QueuedJob("job", "uploads/job.pdf", api_key="sk-secret"))
+    queue.claim("worker-1", lease_seconds=60)
+
+    assert queue.cancel("job").status == "cancelled"
+    assert not queue.heartbeat("job", "worker-1", 60, "Processing", 0.5, [])
+    assert stored_api_key(queue, "job") is None
+
+
+def test_finish_and_release(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue(QueuedJob("done", "uploads/done.pdf", api_key="sk-secret"))
+    queue.enqueue(QueuedJob("released", "uploads/released.pdf"))
+    queue.claim("worker-1", lease_seconds=60)
+    queue.claim("worker-1", lease_seconds=60)
+
+    queue.finish("done", "worker-1", "completed", "Extraction completed successfully", skipped_pages=[3])
+    job = queue.get("done")
+    assert (job.status, job.progress, job.skipped_pages) == ("completed", 1.0, [3])
+    assert stored_api_key(queue, "done") is None
+
+    queue.release("released", "worker-1")
+    job = queue.get("released")
+    assert (job.status, job.attempts, job.worker_id) == ("pending", 0, None)
+
+
+def test_cancelled_pending_job_removes_upload(tmp_path):
+    upload = tmp_path / "job.pdf"
+    upload.write_bytes(b"%PDF")
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue(QueuedJob("job", str(upload)))
+
+    assert queue.cancel("job").status == "cancelled"
+    assert not upload.exists()
+    assert queue.claim("worker-1", lease_seconds=60) is None
+
+
+def test_failed_after_max_attempts_removes_upload(tmp_path):
+    upload = tmp_path / "job.pdf"
+    upload.write_bytes(b"%PDF")
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), max_attempts=1)
+    queue.enqueue(QueuedJob("job", str(upload)))
+
+    queue.claim("worker-1", lease_seconds=0.01)
+    time.sleep(0.05)
+    queue.claim("worker-2", lease_seconds=60)
+    assert not upload.exists()
+
+
+def test_claim_shares_workers_across_keys(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    for i in range(3):
+        queue.enqueue(QueuedJob(f"big-{i}", f"uploads/big-{i}.pdf", key_fingerprint="key-a"))
+    queue.enqueue(QueuedJob("small", "uploads/small.pdf", key_fingerprint="key-b"))
+
+    claimed = [queue.claim("worker-1", lease_seconds=60).extraction_id for _ in range(4)]
+    # key-b does not wait for every job of key-a that was uploaded before it
+    assert claimed == ["big-0", "small", "big-1", "big-2"]
+
+
+def test_claim_honours_key_weights(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), weights={"key-a": 2.0})
+    for i in range(3):
+        queue.enqueue(QueuedJob(f"a-{i}", f"uploads/a-{i}.pdf", key_fingerprint="key-a"))
+        queue.enqueue(QueuedJob(f"b-{i}", f"uploads/b-{i}.pdf", key_fingerprint="key-b"))
+
+    claimed = [queue.claim("worker-1", lease_seconds=60).extraction_id for _ in range(3)]
+    assert claimed == ["a-0", "b-0", "a-1"]
+
+
+def test_usage_is_shared_per_key_and_day(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    assert queue.add_usage("key-a", "2026-01-01", 100) == 100
+    # Another worker with its own connection adds to the same total
+    other = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    assert other.add_usage("key-a", "2026-01-01", 50) == 150
+
+    assert queue.get_usage("key-a", "2026-01-01") == 150
+    assert queue.get_usage("key-a", "2026-01-02") == 0
+    assert queue.get_usage("key-b", "2026-01-01") == 0
+
+
+def test_live_workers_are_counted(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    assert queue.register_worker("worker-1", ttl_seconds=60) == 1
+    assert queue.register_worker("worker-2", ttl_seconds=0.01) == 2
+    assert queue.register_worker("worker-1", ttl_seconds=60) == 2
+
+    # worker-2 stopped renewing its entry
+    time.sleep(0.05)
+    assert queue.register_worker("worker-1", ttl_seconds=60) == 1
+    queue.register_worker("worker-3", ttl_seconds=60)
+    queue.unregister_worker("worker-3")
+    assert queue.register_worker("worker-1", ttl_seconds=60) == 1
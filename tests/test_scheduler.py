@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.queue import SQLiteJobQueue
+from app.services.scheduler import FairScheduler, PageTimeout, TokenBudgetExceeded, TokenBucket, key_fingerprint
+
+
+def record(order, name):
+    time.sleep(0.01)
+    order.append(name)
+    return name
+
+
+def test_small_job_is_not_stuck_behind_large_job_with_same_key():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=10 ** 9)
+        order = []
+        big = [scheduler.run("env-key", record, order, f"A{i}", flow="A") for i in range(20)]
+        big = [asyncio.ensure_future(job) for job in big]
+        await asyncio.sleep(0)
+        small = asyncio.ensure_future(scheduler.run("env-key", record, order, "B0", flow="B"))
+        await asyncio.gather(*big, small)
+        return order
+
+    order = asyncio.run(main())
+    assert order.index("B0") <= 2
+    assert [name for name in order if name.startswith("A")] == [f"A{i}" for i in range(20)]
+
+
+def test_keys_share_workers_fairly():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=10 ** 9)
+        order = []
+        jobs = [asyncio.ensure_future(scheduler.run("key-a", record, order, f"A{i}")) for i in range(6)]
+        await asyncio.sleep(0)
+        jobs += [asyncio.ensure_future(scheduler.run("key-c", record, order, f"C{i}")) for i in range(3)]
+        await asyncio.gather(*jobs)
+        return order
+
+    order = asyncio.run(main())
+    # Once key-c has work queued the two keys alternate
+    assert order[1:7] in (
+        ["C0", "A1", "C1", "A2", "C2", "A3"],
+        ["A1", "C0", "A2", "C1", "A3", "C2"],
+    )
+
+
+def test_requests_per_minute_limit_delays_dispatch():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=4, rpm=60, tpm=10 ** 9)
+        started = time.monotonic()
+        await asyncio.gather(*(scheduler.run("key", lambda: None) for _ in range(62)))
+        return time.monotonic() - started
+
+    # The bucket holds 60 requests and refills one per second
+    assert 1.5 < asyncio.run(main()) < 4
+
+
+def test_tokens_per_minute_limit_delays_dispatch():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=4, rpm=10000, tpm=6000)
+        # A page whose actual usage empties the key's token bucket
+        await scheduler.run("key", scheduler.record_usage, "key", 5000, 1000, estimated_tokens=0)
+        started = time.monotonic()
+        await scheduler.run("key", lambda: None, estimated_tokens=150)
+        return time.monotonic() - started
+
+    # The bucket refills 100 tokens per second
+    assert 1 < asyncio.run(main()) < 3
+
+
+def test_token_bucket_waits_for_tokens():
+    bucket = TokenBucket(per_minute=600)
+    now = bucket.updated_at
+    assert bucket.wait_time(600, now) == 0
+    bucket.take(600)
+    assert bucket.wait_time(100, bucket.updated_at) == pytest.approx(10, rel=0.01)
+    # Requests larger than the bucket only wait for a full bucket
+    assert bucket.wait_time(10 ** 6, bucket.updated_at) == pytest.approx(60, rel=0.01)
+
+
+def test_daily_budget_rejects_pages():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=10 ** 9, daily_budget=100)
+        scheduler.record_usage("key", 60, 30)
+        with pytest.raises(TokenBudgetExceeded):
+            await scheduler.run("key", lambda: None, estimated_tokens=20)
+        return await scheduler.run("key", lambda: "ok", estimated_tokens=10)
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_daily_budget_counts_usage_of_other_processes(tmp_path):
+    async def main():
+        store = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+        # Recorded by another worker, or by this one before it restarted
+        store.add_usage(key_fingerprint("key"), datetime.now(timezone.utc).date().isoformat(), 90)
+        scheduler = FairScheduler(
+            max_concurrency=1, rpm=10000, tpm=10 ** 9, daily_budget=100, usage_store=store
+        )
+        with pytest.raises(TokenBudgetExceeded):
+            await scheduler.run("key", lambda: None, estimated_tokens=20)
+
+        # Usage reported from a page thread is written to the store
+        await scheduler.run("key", scheduler.record_usage, "key", 4, 1, estimated_tokens=10)
+        return store.get_usage(key_fingerprint("key"), datetime.now(timezone.utc).date().isoformat())
+
+    assert asyncio.run(main()) == 95
+
+
+def test_rate_limits_are_split_between_processes():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=4, rpm=120, tpm=10 ** 9)
+        scheduler.set_rate_share(2)
+        started = time.monotonic()
+        # Each of the two processes gets 60 requests per minute
+        await asyncio.gather(*(scheduler.run("key", lambda: None) for _ in range(62)))
+        return time.monotonic() - started
+
+    assert 1.5 < asyncio.run(main()) < 4
+
+
+def test_timeout_raises():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=10 ** 9)
+        with pytest.raises(PageTimeout):
+            await scheduler.run("key", time.sleep, 0.5, timeout=0.05)
+
+    asyncio.run(main())
+
+
+def test_timed_out_job_is_asked_to_stop_and_keeps_its_slot():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=10 ** 9)
+        cancel_event = threading.Event()
+        finished = []
+
+        def slow():
+            cancel_event.wait(1)
+            time.sleep(0.1)
+            finished.append("slow")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.run("key", slow, timeout=0.05, cancel_event=cancel_event)
+        assert cancel_event.is_set()
+        # The next job only starts once the timed out thread has returned
+        await scheduler.run("key", finished.append, "next")
+        return finished
+
+    assert asyncio.run(main()) == ["slow", "next"]
+
+
+def test_abandoned_job_is_charged_its_estimate():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, rpm=10000, tpm=1000, daily_budget=10 ** 6)
+        cancel_event = threading.Event()
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.run(
+                "key", cancel_event.wait, 1, estimated_tokens=400, timeout=0.05, cancel_event=cancel_event
+            )
+        # A job that reported its usage is refunded the estimate as usual
+        await scheduler.run("key", scheduler.record_usage, "key", 50, 50, estimated_tokens=400)
+        tenant = scheduler._tenant("key")
+        return tenant.used_tokens, tenant.tokens.balance
+
+    used, balance = asyncio.run(main())
+    assert used == 500
+    assert balance == pytest.approx(500, abs=5)
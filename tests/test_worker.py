@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+
+from app.core.config import settings
+from app.services.extractor import ExtractionTask
+from app.worker import _publish_partial_output
+
+
+def test_streamed_questions_are_published_for_the_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_PARTIAL_OUTPUT_SECONDS", 0.01)
+    path = tmp_path / "job.partial.json"
+    # Left by an earlier attempt at the job
+    path.write_text(json.dumps([{"question": "stale"}]))
+
+    async def main():
+        task = ExtractionTask("job", "doc")
+        stop = asyncio.Event()
+        publisher = asyncio.create_task(_publish_partial_output(task, str(path), stop))
+        await asyncio.sleep(0.05)
+        first = json.loads(path.read_text())
+
+        task.questions.append({"question": "p1"})
+        task.page_buffers[1] = [{"question": "p2, streaming"}]
+        await asyncio.sleep(0.05)
+        stop.set()
+        await publisher
+        return first, json.loads(path.read_text())
+
+    first, last = asyncio.run(main())
+    assert first == []
+    assert last == [{"question": "p1"}, {"question": "p2, streaming"}]